@@ -1,13 +1,29 @@
-from flask import Flask
 from flask_jwt_extended import JWTManager
 from config import config
 from flask_mongoengine import MongoEngine
 from flask_marshmallow import Marshmallow
+from .activity import ActivityTracker
+from .cache import TTLCache
+from .claims import RoleVersions
+from .compression import Compression
+from .encoding import Flask, json_provider
+from .hashing import PasswordHasher
+from .metrics import Metrics
+from .profiling import Profiler
+from .reads import ReplicaReads
 
 
 mongo = MongoEngine()
 ma = Marshmallow()
 jwt = JWTManager()
+user_cache = TTLCache()
+hasher = PasswordHasher()
+role_versions = RoleVersions()
+metrics = Metrics()
+profiler = Profiler()
+activity = ActivityTracker()
+compression = Compression()
+replica_reads = ReplicaReads()
 
 
 def create_app(config_name):
@@ -15,10 +31,19 @@ def create_app(config_name):
 
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
+    app.json_provider = json_provider(app.config['JSON_PROVIDER'])
 
+    metrics.init_app(app)  # before the MongoDB client exists, so its commands are monitored
     mongo.init_app(app)
     ma.init_app(app)
     jwt.init_app(app)
+    role_versions.init_app(app)
+    hasher.init_app(app)
+    profiler.init_app(app)
+    activity.init_app(app)
+    compression.init_app(app)
+    replica_reads.init_app(app)
+    user_cache.configure(app.config['CURRENT_USER_CACHE_SIZE'], app.config['CURRENT_USER_CACHE_TTL'])
 
     from .api import api as api_blueprint
     app.register_blueprint(api_blueprint, url_prefix='/api')
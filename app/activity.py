@@ -0,0 +1,108 @@
+from datetime import datetime
+from threading import Event, Lock, Thread
+import atexit
+import os
+import time
+from bson import ObjectId
+from flask_jwt_extended import get_jwt_identity
+from pymongo import UpdateOne
+from .metrics import Counter, Gauge, Histogram
+
+
+class ActivityTracker:
+    """Write-behind ``last_seen`` tracking. Each authenticated request records its user in a process buffer,
+    keeping the latest time per user; a background thread writes the buffer as one unordered bulk of $max
+    updates every ACTIVITY_FLUSH_SECONDS, or as soon as it holds ACTIVITY_FLUSH_SIZE users, and once more at exit.
+
+    The updates leave version and updated_at alone, so activity does not invalidate every ETag that covers a
+    user; validators covering a user read last_seen instead (see utils.version_headers). Flushed users are
+    dropped from the current-user cache, so a cached copy is never older than the stored last_seen."""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_seconds = 5
+        self.flush_size = 1000
+        self._buffer = {}
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['ACTIVITY_TRACKING']:
+            return
+        from . import metrics
+        register = metrics.registry.register
+        self.depth = register(Gauge('activity_buffer_users', 'Users waiting for their last_seen to be written.'))
+        self.flush_duration = register(Histogram('activity_flush_duration_seconds', 'last_seen bulk write latency.'))
+        self.flush_errors = register(Counter('activity_flush_errors_total', 'Failed last_seen bulk writes.'))
+
+        if self.app is None:
+            atexit.register(self.stop)
+        self.app = app
+        self.flush_seconds = app.config['ACTIVITY_FLUSH_SECONDS']
+        self.flush_size = app.config['ACTIVITY_FLUSH_SIZE']
+        app.after_request(self._after_request)
+
+    def record(self, user_id, seen_at=None):
+        with self._lock:
+            if self._pid != os.getpid():
+                # first record in this process (or in a forked worker): the buffer and thread are not ours
+                self._buffer, self._pid = {}, os.getpid()
+                self._thread = Thread(target=self._run, name='activity-flusher', daemon=True)
+                self._thread.start()
+        if self._merge({user_id: seen_at or datetime.utcnow()}) >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+        self.depth.set(value=0)
+        if not buffer:
+            return
+        from .models import User
+        from . import user_cache
+
+        operations = [UpdateOne({'_id': ObjectId(user_id)}, {'$max': {'last_seen': seen_at}})
+                      for user_id, seen_at in buffer.items()]
+        start = time.perf_counter()
+        try:
+            User._get_collection().bulk_write(operations, ordered=False)
+            for user_id in buffer:
+                user_cache.invalidate(user_id)
+        except Exception:
+            self.flush_errors.inc()
+            self.app.logger.exception('Writing last_seen of %d users failed', len(buffer))
+            self._merge(buffer)
+        finally:
+            self.flush_duration.observe(time.perf_counter() - start)
+
+    def _merge(self, entries):
+        with self._lock:
+            for user_id, seen_at in entries.items():
+                if seen_at > self._buffer.get(user_id, seen_at.min):
+                    self._buffer[user_id] = seen_at
+            depth = len(self._buffer)
+        self.depth.set(value=depth)
+        return depth
+
+    def stop(self):
+        """Write what is left in the buffer; registered with atexit."""
+        if self._pid == os.getpid():
+            self._pid = None
+            self._wakeup.set()
+            self.flush()
+
+    def _run(self):
+        while self._pid == os.getpid():
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def _after_request(self, response):
+        identity = get_jwt_identity()
+        if identity is not None and ObjectId.is_valid(identity):
+            self.record(identity)
+        return response
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api = Blueprint('api', __name__)
 
-from . import auth, errors, users, posts, comments, follows
\ No newline at end of file
+from . import auth, errors, users, posts, comments, follows, timelines, search, exports
\ No newline at end of file
@@ -1,6 +1,7 @@
-from flask import request
+from flask import request, abort
 from . import api
-from ..models import User
+from ..models import User, CASE_INSENSITIVE
+from .. import hasher
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_refresh_token_required, get_jwt_identity
 from flask.views import MethodView
 
@@ -11,9 +12,15 @@ class UserLoginAPI(MethodView):
         username = request.json.get('username', None)
         password = request.json.get('password', None)
 
-        current_user = User.objects(username=username).first() if password and username else None
+        # collated like the username_ci index, so the lookup is an index match and as case-insensitive as signup
+        current_user = User.objects(username=username, deleted_at=None).collation(CASE_INSENSITIVE).first() \
+            if password and username else None
         if current_user is not None and current_user.check_password(password):
-            return dict(code=200, access_token=create_access_token(identity=str(current_user.id)),
+            if hasher.needs_rehash(current_user.hashed_password):
+                current_user.password = password
+                User.objects(id=current_user.id).update_one(set__hashed_password=current_user.hashed_password)
+            claims = current_user.token_claims()
+            return dict(code=200, access_token=create_access_token(identity=str(current_user.id), user_claims=claims),
                         refresh_token=create_refresh_token(identity=str(current_user.id))), 200
 
         return dict(code=200, message='Invalid username or password.'), 200
@@ -23,7 +30,12 @@ class TokenRefreshAPI(MethodView):
 
     @jwt_refresh_token_required
     def post(self):
-        return dict(code=200, access_token=create_access_token(identity=get_jwt_identity())), 200
+        # reload the user, so the new token carries its current permissions
+        identity = get_jwt_identity()
+        user = User.objects(id=identity, deleted_at=None).only('roles', 'role_version').first()
+        if user is None:
+            abort(401, 'Error loading the user {}'.format(identity))
+        return dict(code=200, access_token=create_access_token(identity=identity, user_claims=user.token_claims())), 200
 
 
 user_login_view = UserLoginAPI.as_view('user_login_api')
@@ -1,84 +1,100 @@
 from . import api
-from ..schemas import CommentSchema
-from ..utils import get_current_user
-from ..models import Post, Comment, Permission
+from ..schemas import comment_schema, comments_schema
+from ..serializers import dump
+from ..utils import get_current_user, get_page_args, slice_embedded_list, embedded_list_window, version_headers, \
+    embedded_not_modified, VERSION_FIELDS
+from ..prefetch import prefetch_references
+from ..models import Post, Comment, Permission, version_bump
 from flask import request, abort
 from flask.views import MethodView
 from marshmallow import ValidationError
 from flask_jwt_extended import jwt_required
-from ..decorators import permission_required_in
+from ..decorators import permission_required_in, secondary_reads
 from bson import ObjectId
+from mongoengine.queryset import transform
+from pymongo import ReturnDocument
 
 
 class CommentAPI(MethodView):
     decorators = [jwt_required]
 
-    def __init__(self):
-        self.comment_schema = CommentSchema()
-        self.comment_schemas = CommentSchema(many=True)
-
+    @secondary_reads
     def get(self, post_id=None, comment_id=None):
-        post = self.get_post(post_id)
-
+        if not ObjectId.is_valid(post_id): abort(404)
+        posts = Post.objects(id=post_id, deleted_at=None)
+        # comments are embedded, so the post's version covers them; the versions of their authors are folded in,
+        # and a conditional request is answered from those versions before any comment is loaded
         if comment_id is None:
             # return a list of comments
-            page = request.args.get('page', type=int, default=1)
-            item_per_page = request.args.get('item_per_page', type=int, default=10)
+            page, item_per_page = get_page_args()
             offset = (page - 1) * item_per_page
-            comments = post.comments[offset:offset + item_per_page]
+            window = {'$slice': ['$comments', offset, item_per_page]}
+            response = embedded_not_modified(posts, 'comments', window, 'author')
+            if response is not None: return response
 
-            return dict(data=self.comment_schemas.dump(comments), has_more=len(comments) == item_per_page, code=200), 200
+            post, comments = slice_embedded_list(posts, 'comments', offset, item_per_page + 1, include=VERSION_FIELDS)
+            if post is None: abort(404)
+            has_more, comments = len(comments) > item_per_page, comments[:item_per_page]
+            prefetch_references(comments, comments_schema, *VERSION_FIELDS)
+            headers = version_headers(post, [comment.author for comment in comments])
+            return dict(data=dump(comments_schema, comments), has_more=has_more, code=200), 200, headers
         else:
             # expose a single comment
-            comment = Post.objects(id=post_id, comment__match={"id": comment_id}).first_or_404()
-            return dict(data=self.comment_schema.dump(comment), code=200), 200
+            if not ObjectId.is_valid(comment_id): abort(404)
+            matching = {'$filter': {'input': '$comments', 'as': 'comment',
+                                    'cond': {'$eq': ['$$comment._id', ObjectId(comment_id)]}}}
+            response = embedded_not_modified(posts.filter(comments__id=comment_id), 'comments', matching, 'author')
+            if response is not None: return response
+
+            # only the matching element of the embedded list leaves MongoDB
+            post, comments = embedded_list_window(posts, 'comments', matching, include=VERSION_FIELDS)
+            if not comments: abort(404)
+            comment = comments[0]
+            prefetch_references([comment], comment_schema, *VERSION_FIELDS)
+            return dict(data=comment_schema.dump(comment), code=200), 200, version_headers(post, [comment.author])
 
     @permission_required_in(Permission.COMMENT, Permission.MODERATE, Permission.ADMIN)
     def post(self, post_id=None):
         # create a new post
+        if not ObjectId.is_valid(post_id): abort(404)
         try:
-            post = self.get_post(post_id)
-            data = self.comment_schema.load(request.json)
+            data = comment_schema.load(request.json)
         except ValidationError as err:
             abort(400, err.messages)
         else:
+            # pushed without reading the post first; a missing or deleted post matches nothing
             comment = Comment(body=data['body'], author=get_current_user())
-            post.comments.append(comment)
-            post.comments.save()
-            return dict(data=self.comment_schema.dump(comment), code=201), 201
+            updated = Post.objects(id=post_id, deleted_at=None).update_one(push__comments=comment, **version_bump())
+            if not updated: abort(404)
+            return dict(data=comment_schema.dump(comment), code=201), 201
 
     @permission_required_in(Permission.COMMENT, Permission.MODERATE, Permission.ADMIN)
     def put(self, post_id=None, comment_id=None):
         # update a single user
+        if not ObjectId.is_valid(post_id) or not ObjectId.is_valid(comment_id): abort(404)
         try:
-            comment = self.get_comment(post_id, comment_id)
-            data = self.comment_schema.load(request.json, partial=True)
+            data = comment_schema.load(request.json, partial=True)
         except ValidationError as err:
             abort(400, err.messages)
         else:
-            Post.objects(comments__id=comment_id).update_one(
-                set__comments__S__body=data.get('body', comment.body),
-                set__comments__S__disabled=data.get('disabled',
-                                                    comment.disabled))
-            return dict(data=self.comment_schema.dump(self.get_comment(post_id, comment_id)), code=200), 200
+            # one findAndModify returning only the matched comment, through the positional projection
+            updates = {'set__comments__S__' + name: data[name] for name in ('body', 'disabled') if name in data}
+            post = Post._get_collection().find_one_and_update(
+                {'_id': ObjectId(post_id), 'deleted_at': None, 'comments._id': ObjectId(comment_id)},
+                transform.update(Post, **updates, **version_bump()),
+                projection={'comments.$': 1}, return_document=ReturnDocument.AFTER)
+            if post is None: abort(404)
+            comment = Comment._from_son(post['comments'][0])
+            return dict(data=comment_schema.dump(comment), code=200), 200
 
     @permission_required_in(Permission.COMMENT, Permission.MODERATE, Permission.ADMIN)
     def delete(self, post_id=None, comment_id=None):
         # delete a single user
-        comment = self.get_comment(post_id, comment_id)
-        Post.objects(comments__id=comment_id).update_one(pull__comments=comment)
-        return dict(code=204), 204
-
-    def get_comment(self, post_id, comment_id):
         if not ObjectId.is_valid(post_id) or not ObjectId.is_valid(comment_id): abort(404)
-        comment = self.get_post(post_id).comments.filter(id=comment_id).first()
-        if comment is None: abort(404)
-        return comment
-
-    @staticmethod
-    def get_post(post_id):
-        if not ObjectId.is_valid(post_id): abort(404)
-        return Post.objects(id=post_id).first_or_404()
+        updated = Post.objects(id=post_id, deleted_at=None, comments__id=comment_id).update_one(
+            __raw__={'$pull': {'comments': {'_id': ObjectId(comment_id)}}}, **version_bump())
+        if not updated: abort(404)
+        return dict(code=204), 204
 
 
 comment_view = CommentAPI.as_view('post_comment_api')
@@ -1,6 +1,7 @@
 from . import api
 from .. import jwt
 from werkzeug.exceptions import HTTPException
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
 
 
 @api.errorhandler(HTTPException)
@@ -11,6 +12,13 @@ def handle_exception(e):
     return _error_handler(e.code, e.description)
 
 
+@api.errorhandler(ConnectionFailure)
+@api.errorhandler(ExecutionTimeout)
+def handle_database_timeout(e):
+    # no server selected, no pooled connection free, or MONGO_MAX_TIME_MS exceeded
+    return _error_handler(503, 'The database is busy, try again later.')
+
+
 @jwt.invalid_token_loader
 def invalid_token_callback(error_string):
     return _error_handler(422, error_string)
@@ -0,0 +1,31 @@
+from . import api
+from ..models import Permission
+from ..export import EXPORTS, export_lines, gzip_stream
+from ..decorators import permission_required_eq
+from flask_jwt_extended import jwt_required
+from flask.views import MethodView
+from flask import request, abort, current_app, Response, stream_with_context
+from bson import ObjectId
+
+
+class ExportAPI(MethodView):
+    decorators = [jwt_required]
+
+    @permission_required_eq(Permission.ADMIN)
+    def get(self, collection):
+        """Stream a whole collection as NDJSON, optionally gzipped"""
+        if collection not in EXPORTS: abort(404)
+        after = request.args.get('after')
+        if after is not None and not ObjectId.is_valid(after): abort(400, 'Invalid after checkpoint.')
+        fields = request.args['fields'].split(',') if request.args.get('fields') else None
+
+        lines = export_lines(collection, after=after, fields=fields,
+                             batch_size=current_app.config['EXPORT_BATCH_SIZE'])
+        if request.args.get('gzip', type=int):
+            return Response(stream_with_context(gzip_stream(lines)), mimetype='application/gzip',
+                            headers={'Content-Disposition': 'attachment; filename={}.ndjson.gz'.format(collection)})
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+
+export_view = ExportAPI.as_view('export_api')
+api.add_url_rule('/export/<string:collection>', view_func=export_view, methods=['GET'])
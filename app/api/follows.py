@@ -1,6 +1,9 @@
 from . import api
-from ..models import User, Follow
-from ..schemas import FollowSchema
+from ..models import Follow, User
+from ..schemas import follower_schema, followers_schema, following_schema, followings_schema
+from ..utils import get_page_args, paginate_by_cursor, paginate_by_page
+from ..prefetch import prefetch_references
+from ..decorators import secondary_reads
 from flask_jwt_extended import jwt_required
 from flask.views import MethodView
 from flask import request, abort
@@ -10,86 +13,70 @@ from bson import ObjectId
 class FollowersAPI(MethodView):
     decorators = [jwt_required]
 
-    def __init__(self):
-        self.follow_schema = FollowSchema()
-        self.follow_schemas = FollowSchema(many=True)
-
+    @secondary_reads
     def get(self, user_id=None, follower_id=None):
         if follower_id is None:
-            page = request.args.get('page', type=int, default=1)
-            item_per_page = request.args.get('item_per_page', type=int, default=10)
-            offset = (page - 1) * item_per_page
-            followers = User.find_user_by_id(user_id).followers[offset:offset + item_per_page]
-            return dict(data=self.follow_schemas.dump(followers), has_more=len(followers) == item_per_page, code=200), 200
+            if not ObjectId.is_valid(user_id): abort(404)
+            data, has_more, next_cursor = paginate_follows(Follow.objects(followee=user_id).project(followers_schema))
+            prefetch_references(data, followers_schema)
+            return dict(data=followers_schema.dump(data), has_more=has_more, next_cursor=next_cursor, code=200), 200
         else:
-            follower = Follow.find_follower_by_id(user_id, follower_id)
-            return dict(data=self.follow_schema.dump(follower), code=200), 200
-
-    @staticmethod
-    def get_follower(user_id=None, follower_id=None):
-        if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(follower_id): abort(404)
-        return User.objects(id=user_id, followers__match={"id": follower_id}).first_or_404()
+            follow = Follow.find_follow(follower_id, user_id)
+            return dict(data=follower_schema.dump(follow), code=200), 200
 
 
 class FollowingsAPI(MethodView):
     decorators = [jwt_required]
 
-    def __init__(self):
-        self.follow_schema = FollowSchema()
-        self.follow_schemas = FollowSchema(many=True)
-
+    @secondary_reads
     def get(self, user_id=None, follower_id=None):
         if follower_id is None:
-            page = request.args.get('page', type=int, default=1)
-            item_per_page = request.args.get('item_per_page', type=int, default=10)
-            offset = (page - 1) * item_per_page
-            followings = User.find_user_by_id(user_id).followings[offset:offset + item_per_page]
-            return dict(data=self.follow_schemas.dump(followings), has_more=len(followings) == item_per_page, code=200), 200
+            if not ObjectId.is_valid(user_id): abort(404)
+            data, has_more, next_cursor = paginate_follows(Follow.objects(follower=user_id).project(followings_schema))
+            prefetch_references(data, followings_schema)
+            return dict(data=followings_schema.dump(data), has_more=has_more, next_cursor=next_cursor, code=200), 200
         else:
-            follower = Follow.find_follower_by_id(user_id, follower_id)
-            return dict(data=self.follow_schema.dump(follower), code=200), 200
-
-    @staticmethod
-    def get_follower(user_id=None, follower_id=None):
-        if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(follower_id): abort(404)
-        return User.objects(id=user_id, followers__match={"id": follower_id}).first_or_404()
+            follow = Follow.find_follow(user_id, follower_id)
+            return dict(data=following_schema.dump(follow), code=200), 200
 
 
 class FollowAPI(MethodView):
     decorators = [jwt_required]
 
-    def post(self, user_id, user_to_follow_id):
-        user = User.find_user_by_id(user_id)
-        user_to_follow = User.find_user_by_id(user_to_follow_id)
-
-        if user.is_followed(user_to_follow) and user_to_follow.is_following(user):
-            return dict(code=200, message='You are already following %s.' % user.username), 200
+    def post(self, user_id, follower_id):
+        check_follow(user_id, follower_id)
 
-        user_to_follow.followings.append(Follow(follower=user))
-        user_to_follow.followings.save()
+        if not Follow.follow(follower_id, user_id):
+            return dict(code=200, message='You are already following this user.'), 200
 
-        user.followers.append(Follow(follower=user_to_follow))
-        user.followers.save()
-
-        return dict(code=200, message='You are now following %s.' % user.username), 200
+        return dict(code=200, message='You are now following this user.'), 200
 
 
 class UnFollowAPI(MethodView):
     decorators = [jwt_required]
 
-    def post(self, user_id, user_to_follow_id):
-        user = User.find_user_by_id(user_id)
-        user_to_follow = User.find_user_by_id(user_to_follow_id)
+    def post(self, user_id, follower_id):
+        check_follow(user_id, follower_id)
+
+        if not Follow.unfollow(follower_id, user_id):
+            return dict(code=200, message='You are already not following this user.'), 200
+
+        return dict(code=200, message='You are now not following this user.'), 200
+
+
+def check_follow(user_id, follower_id):
+    # both users must exist and not be deleted, checked with one count instead of loading either of them
+    if not ObjectId.is_valid(user_id) or not ObjectId.is_valid(follower_id): abort(404)
+    if ObjectId(user_id) == ObjectId(follower_id): abort(400, 'Users cannot follow themselves.')
+    if User.objects(id__in=[user_id, follower_id], deleted_at=None).only('id').count() != 2: abort(404)
 
-        if not user.is_followed(user_to_follow) and not user_to_follow.is_following(user):
-            return dict(code=200, message='You are already not following %s.' % user.username), 200
 
-        user_follower = user.followers.filter(follower=user_to_follow).first()
-        follower_follower = user_to_follow.followings.filter(follower=user).first()
+def paginate_follows(follows):
+    page, item_per_page = get_page_args()
+    if 'cursor' in request.args:
+        return paginate_by_cursor(follows, request.args['cursor'], item_per_page)
 
-        User.objects(id=user_id).update_one(pull__followers=user_follower)
-        User.objects(id=user_to_follow_id).update_one(pull__followings=follower_follower)
-        return dict(code=200, message='You are now not following %s.' % user.username), 200
+    return paginate_by_page(follows.order_by('-timestamp', '-id'), page, item_per_page) + (None,)
 
 
 followers_view = FollowersAPI.as_view('followers_api')
@@ -104,4 +91,4 @@ follow_view = FollowAPI.as_view('follow_api')
 api.add_url_rule('/users/<string:user_id>/follow/<string:follower_id>', view_func=follow_view, methods=['POST'])
 
 unfollow_view = UnFollowAPI.as_view('unfollow_api')
-api.add_url_rule('/users/<string:user_id>/unfollow/<string:follower_id>', view_func=unfollow_view, methods=['POST'])
\ No newline at end of file
+api.add_url_rule('/users/<string:user_id>/unfollow/<string:follower_id>', view_func=unfollow_view, methods=['POST'])
@@ -1,68 +1,127 @@
 from . import api
 from flask_jwt_extended import jwt_required
-from ..models import Post, Permission
-from ..schemas import PostSchema
-from ..decorators import permission_required_in
-from ..utils import get_current_user
+from ..models import Post, Timeline, Permission, version_bump
+from ..schemas import post_schema, posts_schema
+from ..serializers import dump
+from ..decorators import permission_required_in, secondary_reads
+from ..utils import get_current_user, paginate_by_cursor, paginate_by_page, get_page_args, version_headers, \
+    not_modified, get_by_ids, VERSION_FIELDS
+from ..prefetch import prefetch_references
 from flask.views import MethodView
-from flask import request, abort, g
+from flask import request, abort, current_app
+from pymongo.errors import BulkWriteError
 from marshmallow import ValidationError
 from datetime import datetime
+from bson import ObjectId
 
 
 class PostAPI(MethodView):
     decorators = [jwt_required]
 
-    def __init__(self):
-        self.post_schemas = PostSchema(many=True)
-        self.post_schema = PostSchema()
-
+    @secondary_reads
     def get(self, post_id=None):
         """List all posts"""
         if post_id is None:
             # return a list of posts
-            page = request.args.get('page', type=int, default=1)
-            item_per_page = request.args.get('item_per_page', type=int, default=10)
-            paginator = Post.objects(delete_at=None).paginate(page, per_page=item_per_page)
-            return dict(data=self.post_schemas.dump(paginator.items), has_more=paginator.pages > page, code=200), 200
+            if 'ids' in request.args:
+                items, missing = get_by_ids(Post.objects(deleted_at=None).project(posts_schema))
+                prefetch_references(items, posts_schema)
+                return dict(data=dump(posts_schema, items), missing=missing, code=200), 200
+
+            page, item_per_page = get_page_args()
+            posts = Post.objects(deleted_at=None).project(posts_schema)
+            if 'cursor' in request.args:
+                items, has_more, next_cursor = paginate_by_cursor(posts, request.args['cursor'], item_per_page)
+                prefetch_references(items, posts_schema)
+                return dict(data=dump(posts_schema, items), has_more=has_more, next_cursor=next_cursor, code=200), 200
+            items, has_more = paginate_by_page(posts, page, item_per_page)
+            prefetch_references(items, posts_schema)
+            return dict(data=dump(posts_schema, items), has_more=has_more, code=200), 200
         else:
             # expose a single post
-            post = Post.find_post_by_id(post_id)
-            return dict(data=self.post_schema.dump(post), code=200), 200
+            if not ObjectId.is_valid(post_id): abort(404)
+            response = not_modified(Post.objects(id=post_id, deleted_at=None), references=('author',))
+            if response is not None: return response
+            post = Post.objects(id=post_id, deleted_at=None).project(post_schema, *VERSION_FIELDS).first_or_404()
+            prefetch_references([post], post_schema, *VERSION_FIELDS)
+            return dict(data=post_schema.dump(post), code=200), 200, version_headers(post, [post.author])
 
     @permission_required_in(Permission.WRITE, Permission.MODERATE, Permission.ADMIN)
     def post(self):
         # create a new post
         try:
-            data = self.post_schema.load(request.json)
+            data = post_schema.load(request.json)
         except ValidationError as err:
             abort(400, err.messages)
         else:
             post = Post(image_url=data['image_url'], title=data['title'], body=data['body'], author=get_current_user())
             post.save(force_insert=True)
-            return dict(data=self.post_schema.dump(post), code=201), 201
+            Timeline.fan_out(post.author, [post])
+            return dict(data=post_schema.dump(post), code=201), 201
 
     @permission_required_in(Permission.WRITE, Permission.MODERATE, Permission.ADMIN)
     def put(self, post_id):
         # update a single post
+        if not ObjectId.is_valid(post_id): abort(404)
         try:
-            post = Post.find_post_by_id(post_id)
-            data = self.post_schema.load(request.json, partial=True, unknown=True)
+            data = post_schema.load(request.json, partial=True, unknown=True)
         except ValidationError as err:
             abort(400, err.messages)
         else:
-            post.update(set__image_url=data.get('image_url', post.image_url), set__title=data.get('title', post.title), set__body=data.get('body', post.body))
-            post.reload()
-            return dict(data=self.post_schema.dump(post), code=200), 200
+            # one findAndModify: the 404 comes from a missing result instead of a pre-read
+            updates = {'set__' + name: data[name] for name in ('image_url', 'title', 'body') if name in data}
+            post = Post.objects(id=post_id, deleted_at=None).project(post_schema).modify(
+                new=True, **updates, **version_bump())
+            if post is None: abort(404)
+            return dict(data=post_schema.dump(post), code=200), 200
 
     @permission_required_in(Permission.WRITE, Permission.MODERATE, Permission.ADMIN)
     def delete(self, post_id):
         # delete a single post
-        post = Post.find_post_by_id(post_id)
-        post.update(set__delete_at=datetime.utcnow())
-        return dict(data=self.post_schema.dump(post), code=204), 204
+        if not ObjectId.is_valid(post_id): abort(404)
+        post = Post.objects(id=post_id, deleted_at=None).project(post_schema).modify(
+            new=True, set__deleted_at=datetime.utcnow(), **version_bump())
+        if post is None: abort(404)
+        return dict(data=post_schema.dump(post), code=204), 204
+
+
+class PostBulkAPI(MethodView):
+    decorators = [jwt_required]
+
+    @permission_required_in(Permission.WRITE, Permission.MODERATE, Permission.ADMIN)
+    def post(self):
+        # create a batch of posts, reporting errors per item
+        if not isinstance(request.json, list): abort(400, 'Expected a list of posts.')
+        if len(request.json) > current_app.config['BULK_MAX_ITEMS']:
+            abort(400, 'At most {} posts can be created at once.'.format(current_app.config['BULK_MAX_ITEMS']))
+
+        try:
+            items, errors = posts_schema.load(request.json), {}
+        except ValidationError as err:
+            items, errors = err.valid_data, err.messages
+
+        author = get_current_user()
+        posts = {index: Post(id=ObjectId(), image_url=data['image_url'], title=data['title'], body=data['body'],
+                             author=author) for index, data in enumerate(items) if index not in errors}
+        indexes = list(posts)
+        if posts:
+            try:
+                Post._get_collection().insert_many([post.to_mongo() for post in posts.values()], ordered=False)
+            except BulkWriteError as err:
+                for write_error in err.details['writeErrors']:
+                    errors[indexes[write_error['index']]] = [write_error['errmsg']]
+                    del posts[indexes[write_error['index']]]
+            Timeline.fan_out(author, list(posts.values()))
+
+        created = sorted(posts.items())
+        data = [dict(index=index, data=item)
+                for (index, _), item in zip(created, dump(posts_schema, [post for _, post in created]))]
+        return dict(data=data, errors=errors, code=207 if errors else 201), 207 if errors else 201
 
 
 post_view = PostAPI.as_view('post_api')
 api.add_url_rule('/posts/', view_func=post_view, methods=['GET', 'POST'])
 api.add_url_rule('/posts/<string:post_id>', view_func=post_view, methods=['GET', 'PUT', 'DELETE'])
+
+post_bulk_view = PostBulkAPI.as_view('post_bulk_api')
+api.add_url_rule('/posts/bulk', view_func=post_bulk_view, methods=['POST'])
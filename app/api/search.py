@@ -0,0 +1,43 @@
+from . import api
+from ..models import Post
+from ..schemas import posts_schema
+from ..serializers import dump
+from ..utils import get_page_args, encode_score_cursor, decode_score_cursor
+from ..prefetch import prefetch_references, schema_projection
+from ..decorators import secondary_reads
+from flask_jwt_extended import jwt_required
+from flask.views import MethodView
+from flask import request, abort
+
+
+class PostSearchAPI(MethodView):
+    decorators = [jwt_required]
+
+    @secondary_reads
+    def get(self):
+        """Search posts by title, body and comment bodies, most relevant first"""
+        query = request.args.get('q', '').strip()
+        if not query: abort(400, 'The q parameter is required.')
+        _, item_per_page = get_page_args()
+
+        pipeline = [{'$match': {'$text': {'$search': query}, 'deleted_at': None}},
+                    {'$addFields': {'score': {'$meta': 'textScore'}}}]
+        if request.args.get('cursor'):
+            score, object_id = decode_score_cursor(request.args['cursor'])
+            pipeline.append({'$match': {'$or': [{'score': {'$lt': score}},
+                                                {'score': score, '_id': {'$lt': object_id}}]}})
+        pipeline += [{'$sort': {'score': -1, '_id': -1}}, {'$limit': item_per_page + 1},
+                     {'$project': dict(schema_projection(posts_schema, Post), score=1)}]
+
+        results = list(Post.objects.aggregate(*pipeline))
+        has_more = len(results) > item_per_page
+        results = results[:item_per_page]
+        next_cursor = encode_score_cursor(results[-1]['score'], results[-1]['_id']) if has_more else None
+
+        posts = [Post._from_son({key: value for key, value in result.items() if key != 'score'}) for result in results]
+        prefetch_references(posts, posts_schema)
+        return dict(data=dump(posts_schema, posts), has_more=has_more, next_cursor=next_cursor, code=200), 200
+
+
+post_search_view = PostSearchAPI.as_view('post_search_api')
+api.add_url_rule('/posts/search', view_func=post_search_view, methods=['GET'])
@@ -0,0 +1,62 @@
+from . import api
+from ..models import Post, Timeline, Permission
+from ..schemas import posts_schema
+from ..serializers import dump
+from ..utils import get_page_args, decode_cursor, encode_cursor, get_current_permissions, has_permissions
+from ..prefetch import prefetch_references
+from ..decorators import secondary_reads
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask.views import MethodView
+from flask import request, abort
+from bson import ObjectId
+
+
+class TimelineAPI(MethodView):
+    decorators = [jwt_required]
+
+    @secondary_reads
+    def get(self, user_id):
+        """Home timeline: posts by the accounts a user follows, newest first"""
+        if not ObjectId.is_valid(user_id): abort(404)
+        if get_jwt_identity() != user_id and not has_permissions(get_current_permissions(), Permission.ADMIN):
+            abort(401, 'You do not have sufficient permissions to access this page.')
+        _, item_per_page = get_page_args()
+        before = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = item_per_page + 1
+
+        # posts of followed accounts that are too large to fan out are all live, so the newest page-and-one of
+        # them is pulled once; the fanned-out entries are merged in below
+        pulled = Timeline.pull(Timeline.pulled_followees(user_id), before, limit)
+        entries = {post_id: timestamp for timestamp, post_id in pulled}
+        posts, load = {}, list(entries)
+
+        # entries of deleted posts stay in the timeline, so read on until one more live post than a page is newer
+        # than every unread entry
+        read_to, exhausted = None, False
+        while not exhausted:
+            settled = 0 if read_to is None else sum(1 for post_id in posts if (entries[post_id], post_id) >= read_to)
+            if settled >= limit: break
+            read = Timeline.read(user_id, read_to or before, limit - settled)
+            exhausted = len(read) < limit - settled
+            for timestamp, post_id in read:
+                if post_id not in entries:
+                    entries[post_id] = timestamp
+                    load.append(post_id)
+            if load:
+                posts.update((post.id, post) for post in
+                             Post.objects(id__in=load, deleted_at=None).project(posts_schema))
+                load = []
+            if read: read_to = read[-1]
+
+        posts = sorted(((entries[post_id], post) for post_id, post in posts.items()),
+                       key=lambda entry: (entry[0], entry[1].id), reverse=True)[:limit]
+        has_more = len(posts) > item_per_page
+        posts = posts[:item_per_page]
+        next_cursor = encode_cursor(posts[-1][0], posts[-1][1].id) if has_more else None
+        posts = [post for _, post in posts]
+        prefetch_references(posts, posts_schema)
+        return dict(data=dump(posts_schema, posts), has_more=has_more, next_cursor=next_cursor, code=200), 200
+
+
+timeline_view = TimelineAPI.as_view('timeline_api')
+api.add_url_rule('/users/<string:user_id>/timeline', view_func=timeline_view, methods=['GET'])
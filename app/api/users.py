@@ -1,66 +1,90 @@
 from . import api
-from ..models import User, Permission
-from ..schemas import UserSchema
-from ..decorators import permission_required_eq
+from ..models import User, Permission, version_bump
+from ..schemas import user_schema, users_schema, duplicate_key_errors
+from ..decorators import permission_required_eq, secondary_reads
+from ..utils import paginate_by_cursor, paginate_by_page, get_page_args, version_headers, not_modified, \
+    get_by_ids, USER_VERSION_FIELDS
+from .. import user_cache, hasher
 from flask.views import MethodView
 from flask import request, abort
 from marshmallow import ValidationError
+from mongoengine.errors import NotUniqueError
 from datetime import datetime
+from bson import ObjectId
 
 
 class UserAPI(MethodView):
 
-    def __init__(self):
-        self.user_schemas = UserSchema(many=True)
-        self.user_schema = UserSchema()
-
     @permission_required_eq(Permission.ADMIN)
+    @secondary_reads
     def get(self, user_id=None):
         """List all users"""
         if user_id is None:
             # return a list of users
-            page = request.args.get('page', type=int, default=1)
-            item_per_page = request.args.get('item_per_page', type=int, default=10)
-            paginator = User.objects(deleted_at=None).paginate(page, per_page=item_per_page)
-            return dict(code=200, data=self.user_schemas.dump(paginator.items), has_more=paginator.pages > page), 200
+            if 'ids' in request.args:
+                items, missing = get_by_ids(User.objects(deleted_at=None).project(users_schema))
+                return dict(code=200, data=users_schema.dump(items), missing=missing), 200
+
+            page, item_per_page = get_page_args()
+            users = User.objects(deleted_at=None).project(users_schema)
+            if 'cursor' in request.args:
+                items, has_more, next_cursor = paginate_by_cursor(users, request.args['cursor'], item_per_page,
+                                                                  field='member_since')
+                return dict(code=200, data=users_schema.dump(items), has_more=has_more, next_cursor=next_cursor), 200
+            items, has_more = paginate_by_page(users, page, item_per_page)
+            return dict(code=200, data=users_schema.dump(items), has_more=has_more), 200
         else:
             # expose a single user
-            user = User.find_user_by_id(user_id)
-            return dict(data=self.user_schema.dump(user), code=200), 200
+            if not ObjectId.is_valid(user_id): abort(404)
+            response = not_modified(User.objects(id=user_id, deleted_at=None), fields=USER_VERSION_FIELDS)
+            if response is not None: return response
+            user = User.objects(id=user_id, deleted_at=None).project(user_schema, *USER_VERSION_FIELDS).first_or_404()
+            return dict(data=user_schema.dump(user), code=200), 200, version_headers(user)
 
     def post(self):
         # create a new user
         try:
-            data = self.user_schema.load(request.json)
+            data = user_schema.load(request.json)
         except ValidationError as err:
             abort(400, err.messages)
         else:
             user = User(first_name=data['first_name'], last_name=data['last_name'], phone=data['phone'],
                         email=data['email'], username=data['username'])
             user.password = data['password']
-            user.save(force_insert=True)
-            return dict(data=self.user_schema.dump(user), code=201), 201
+            try:
+                user.save(force_insert=True)
+            except NotUniqueError as err:
+                abort(400, duplicate_key_errors(err))
+            return dict(data=user_schema.dump(user), code=201), 201
 
     @permission_required_eq(Permission.ADMIN)
     def put(self, user_id):
         # update a single user
+        if not ObjectId.is_valid(user_id): abort(404)
         try:
-            user = User.find_user_by_id(user_id)
-            data = self.user_schema.load({**request.json, 'user_id': str(user.id)}, partial=True, unknown=True)
+            data = user_schema.load({**request.json, 'user_id': user_id}, partial=True, unknown=True)
         except ValidationError as err:
             abort(400, err.messages)
         else:
-            if 'password' in data: user.password = data['password']
-            user.update(set__first_name=data.get('first_name', user.first_name), set__last_name=data.get('last_name', user.last_name), set__phone=data.get('phone', user.phone),
-                        set__email=data.get('email', user.email), set__username=data.get('username', user.username), set__hashed_password=user.hashed_password)
-            user.reload()
-            return dict(code=200, data=self.user_schema.dump(user)), 200
+            # one findAndModify: the 404 comes from a missing result instead of a pre-read
+            updates = {'set__' + name: data[name] for name in ('first_name', 'last_name', 'phone', 'email', 'username')
+                       if name in data}
+            if 'password' in data: updates['set__hashed_password'] = hasher.hash(data['password'])
+            try:
+                user = User.objects(id=user_id, deleted_at=None).project(user_schema).modify(
+                    new=True, **updates, **version_bump())
+            except NotUniqueError as err:
+                abort(400, duplicate_key_errors(err))
+            if user is None: abort(404)
+            user_cache.invalidate(user_id)
+            return dict(code=200, data=user_schema.dump(user)), 200
 
     @permission_required_eq(Permission.ADMIN)
     def delete(self, user_id):
         # delete a single user
         user = User.find_user_by_id(user_id)
-        user.update(set__delete_at=datetime.utcnow())
+        user.update(set__deleted_at=datetime.utcnow(), inc__role_version=1, **version_bump())
+        user_cache.invalidate(str(user.id))
         return dict(code=204)
 
 
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+import time
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.write_concern import WriteConcern
+from .models import Post, User
+
+
+# Collections whose soft-deleted rows can be archived, each into a '<collection>_archive' collection.
+ARCHIVES = {'posts': Post, 'users': User}
+
+
+def archive_collection(document):
+    collection = document._get_collection()
+    return collection.database[collection.name + '_archive']
+
+
+def archive_deleted(name, days, batch_size=500, rate=None):
+    """Move the rows of a collection that were soft-deleted more than ``days`` ago into its archive collection,
+    yielding the number of rows moved per batch.
+
+    Each batch is upserted into the archive before it is deleted from the live collection, so an interrupted
+    run is safe to repeat. Deletes wait for a majority of the replica set, and with ``rate`` the batches are
+    spaced so that at most that many rows move per second."""
+    document = ARCHIVES[name]
+    collection = document._get_collection().with_options(write_concern=WriteConcern(w='majority'))
+    archive = archive_collection(document)
+    query = {'deleted_at': {'$type': 'date', '$lt': datetime.utcnow() - timedelta(days=days)}}
+
+    while True:
+        start = time.monotonic()
+        rows = list(collection.find(query, limit=batch_size))
+        if not rows:
+            return
+        archive.bulk_write([ReplaceOne({'_id': row['_id']}, row, upsert=True) for row in rows], ordered=False)
+        collection.bulk_write([DeleteOne({'_id': row['_id'], 'deleted_at': row['deleted_at']}) for row in rows],
+                              ordered=False)
+        yield len(rows)
+        if rate:
+            time.sleep(max(0, len(rows) / rate - (time.monotonic() - start)))
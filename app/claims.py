@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+from threading import Lock
+import time
+
+
+class RoleVersions:
+    """Process-local table of the role versions of users whose roles changed, or who were deleted, within the
+    lifetime of a refresh token. It is reloaded from MongoDB at most every CLAIMS_REFRESH_SECONDS, so a token
+    carrying an older role version is refused within that window."""
+
+    def __init__(self, app=None):
+        self.refresh_seconds = 30
+        self.lookback = None
+        self._versions = {}
+        self._synced_at = None
+        self._checked_at = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Must run after JWTManager.init_app, which sets the default token lifetimes."""
+        self.refresh_seconds = app.config['CLAIMS_REFRESH_SECONDS']
+        self.lookback = app.config['JWT_REFRESH_TOKEN_EXPIRES'] or None
+        with self._lock:
+            self._versions = {}
+            self._synced_at = self._checked_at = None
+
+    def allows(self, identity, role_version):
+        self._refresh()
+        return role_version >= self._versions.get(identity, 0)
+
+    def _refresh(self):
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+                return
+            from .models import User
+
+            now = datetime.utcnow()
+            users = User.objects(role_version__gt=0)
+            if self._synced_at is not None:
+                # overlap the previous sync, for writes committed while it ran
+                users = users.filter(updated_at__gte=self._synced_at - timedelta(seconds=self.refresh_seconds))
+            elif self.lookback is not None:
+                users = users.filter(updated_at__gte=now - self.lookback)
+            for user in users.only('id', 'role_version').as_pymongo():
+                self._versions[str(user['_id'])] = user['role_version']
+            self._synced_at, self._checked_at = now, time.monotonic()
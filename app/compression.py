@@ -0,0 +1,94 @@
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipCompressor:
+
+    def __init__(self, config):
+        self._compressor = zlib.compressobj(config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+
+    def __init__(self, config):
+        self._compressor = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def compress_stream(chunks, compressor):
+    """Compress an iterable of body chunks as it is consumed, without buffering the whole body."""
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def split(data, size):
+    view = memoryview(data)
+    return (view[offset:offset + size] for offset in range(0, len(data), size))
+
+
+class Compression:
+    """Compresses COMPRESS_MIMETYPES responses with brotli (when installed) or gzip, as negotiated through
+    Accept-Encoding. Bodies under COMPRESS_MIN_SIZE are sent as they are; streamed bodies and bodies over
+    COMPRESS_STREAM_SIZE are compressed chunk by chunk while they are sent."""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, app=None):
+        self.compressors = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['COMPRESS_ENABLED']:
+            return
+        self.compressors = {'gzip': GzipCompressor}
+        if brotli is not None:
+            self.compressors = {'br': BrotliCompressor, 'gzip': GzipCompressor}
+        app.after_request(self._after_request)
+
+    def _after_request(self, response):
+        config = current_app.config
+        if response.mimetype not in config['COMPRESS_MIMETYPES'] or 'Content-Encoding' in response.headers \
+                or response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(list(self.compressors))
+        if encoding is None:
+            return response
+
+        size = None if response.is_streamed else response.calculate_content_length()
+        if size is not None and size < config['COMPRESS_MIN_SIZE']:
+            return response
+        compressor = self.compressors[encoding](config)
+        if size is None or size >= config['COMPRESS_STREAM_SIZE']:
+            chunks = response.response if size is None else split(response.get_data(), self.CHUNK_SIZE)
+            response.response = compress_stream(chunks, compressor)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compressor.compress(response.get_data()) + compressor.flush())
+
+        response.headers['Content-Encoding'] = encoding
+        # the compressed body is a different representation, so its validator can only be weak
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -1,14 +1,17 @@
 from functools import wraps
-from .utils import get_current_user, has_permissions
+from .utils import get_current_permissions, has_permissions
+from . import replica_reads
 from flask import abort
+from flask_jwt_extended import get_raw_jwt, verify_jwt_in_request
 
 
 def permission_required_in(*perms):
     def check_permission(func):
         @wraps(func)
         def wrapped(*args, **kwargs):
-            user = get_current_user()
-            if user is None or not has_permissions(user, *perms):
+            if not get_raw_jwt():
+                verify_jwt_in_request()
+            if not has_permissions(get_current_permissions(), *perms):
                 abort(401, 'You do not have sufficient permissions to access this page.')
             return func(*args, **kwargs)
         return wrapped
@@ -16,4 +19,13 @@ def permission_required_in(*perms):
 
 
 def permission_required_eq(perm):
-    return permission_required_in(perm)
\ No newline at end of file
+    return permission_required_in(perm)
+
+
+def secondary_reads(func):
+    """Let a GET handler read from a secondary, within MONGO_MAX_STALENESS_SECONDS of the primary."""
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        replica_reads.route()
+        return func(*args, **kwargs)
+    return wrapped
@@ -0,0 +1,72 @@
+from datetime import date, datetime
+import json
+from bson import ObjectId
+import flask
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """Flask's encoder, writing ObjectIds as strings and dates in ISO 8601 like orjson does."""
+
+    def default(self, o):
+        if isinstance(o, (ObjectId, datetime, date)):
+            return _default(o)
+        return super(JSONEncoder, self).default(o)
+
+
+class StdlibJSON:
+    name = 'stdlib'
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonJSON:
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj, default=_default)
+        except TypeError:
+            # orjson only takes string keys (bulk errors are keyed by index) and 64-bit integers
+            return StdlibJSON.dumps(obj)
+
+
+JSON_PROVIDERS = {'stdlib': StdlibJSON, 'orjson': OrjsonJSON}
+
+
+def json_provider(name):
+    """The provider for JSON_PROVIDER: 'orjson', 'stdlib', or 'auto' for orjson when it is installed."""
+    if name == 'auto':
+        name = 'stdlib' if orjson is None else 'orjson'
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER is orjson, but orjson is not installed.')
+    return JSON_PROVIDERS[name]()
+
+
+class Flask(flask.Flask):
+    """Serializes the dicts returned by views and error handlers with ``json_provider`` instead of jsonify."""
+    json_encoder = JSONEncoder
+    json_provider = StdlibJSON()
+
+    def make_response(self, rv):
+        body = rv[0] if isinstance(rv, tuple) else rv
+        if isinstance(body, dict):
+            response = self.response_class(self.json_provider.dumps(body), mimetype=self.config['JSONIFY_MIMETYPE'])
+            rv = (response,) + rv[1:] if isinstance(rv, tuple) else response
+        return super(Flask, self).make_response(rv)
@@ -0,0 +1,39 @@
+from bson import ObjectId, json_util
+from bson.json_util import RELAXED_JSON_OPTIONS
+import zlib
+from .models import Post, User, Follow
+
+
+# Collections that can be exported, with the fields an export may include. Secrets are never exported.
+EXPORTS = {
+    'posts': (Post, ('title', 'body', 'image_url', 'timestamp', 'updated_at', 'deleted_at', 'author', 'comments')),
+    'users': (User, ('username', 'email', 'first_name', 'last_name', 'phone', 'about_me', 'address', 'member_since',
+                     'last_seen', 'confirmed', 'deleted_at', 'roles', 'followers_count', 'followings_count')),
+    'follows': (Follow, ('follower', 'followee', 'timestamp')),
+}
+
+
+def export_lines(name, after=None, fields=None, batch_size=1000):
+    """Yield a collection as NDJSON in _id order, from a server-side cursor. Pass the last exported _id as
+    ``after`` to resume an interrupted export."""
+    document, allowed = EXPORTS[name]
+    fields = [field for field in fields or allowed if field in allowed]
+    query = {'_id': {'$gt': ObjectId(after)}} if after else {}
+
+    cursor = document._get_collection().find(query, {field: 1 for field in fields}, sort=[('_id', 1)],
+                                             batch_size=batch_size)
+    try:
+        for row in cursor:
+            yield json_util.dumps(row, json_options=RELAXED_JSON_OPTIONS) + '\n'
+    finally:
+        cursor.close()
+
+
+def gzip_stream(lines, level=6):
+    """Compress a stream of text lines into gzip chunks, without buffering the whole body."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for line in lines:
+        chunk = compressor.compress(line.encode())
+        if chunk:
+            yield chunk
+    yield compressor.flush()
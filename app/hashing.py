@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+import os
+import sys
+from flask import abort
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+def normalize_method(method):
+    """Spell out the pbkdf2 iteration count the way werkzeug records it in the hash."""
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return '{}:{}'.format(method, DEFAULT_PBKDF2_ITERATIONS)
+    return method
+
+
+def gevent_patched():
+    """True once gevent has monkey patched threading, without importing gevent when it is not in use."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+class PasswordHasher:
+    """Runs werkzeug's password hashing in a bounded process pool, so CPU-bound hashing does not starve the
+    request threads. Under gevent the pool is made of native threads from gevent's hub instead, which keeps
+    hashing off the event loop since hashlib's pbkdf2 releases the GIL. With no workers configured, hashing
+    runs inline on the calling thread."""
+
+    def __init__(self, app=None):
+        self.method = normalize_method('pbkdf2:sha256')
+        self.workers = 0
+        self._slots = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self._slots = BoundedSemaphore(app.config['PASSWORD_HASH_MAX_IN_FLIGHT'])
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, hashed_password, password):
+        return self._run(check_password_hash, hashed_password, password)
+
+    def needs_rehash(self, hashed_password):
+        return hashed_password.split('$', 1)[0] != self.method
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            abort(503, 'Too many password operations in progress, try again later.')
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        # A pool does not survive a fork, so every worker process builds its own on first use.
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                if gevent_patched():
+                    from gevent.threadpool import ThreadPoolExecutor
+                    self._executor = ThreadPoolExecutor(self.workers)
+                else:
+                    self._executor = ProcessPoolExecutor(self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
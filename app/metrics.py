@@ -0,0 +1,221 @@
+from collections import defaultdict
+from threading import Lock
+import bisect
+import hmac
+import time
+from bson import BSON
+from flask import Response, abort, g, request, has_request_context
+from pymongo import monitoring
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = Lock()
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.kind)]
+        with self._lock:
+            lines += self._samples()
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super(Counter, self).__init__(name, documentation, labels)
+        self._values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def _samples(self):
+        return ['{}{} {}'.format(self.name, _format_labels(self.labels, labels), value)
+                for labels, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def _samples(self):
+        samples = []
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                samples.append('{}_bucket{} {}'.format(self.name, _format_labels(self.labels, labels, [('le', bound)]),
+                                                       cumulative))
+            samples.append('{}_sum{} {}'.format(self.name, _format_labels(self.labels, labels), total))
+            samples.append('{}_count{} {}'.format(self.name, _format_labels(self.labels, labels), cumulative))
+        return samples
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        return '\n'.join(line for metric in list(self.metrics.values()) for line in metric.render()) + '\n'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Counts MongoDB commands, their time and reply size, globally and for the request that issued them."""
+
+    def __init__(self, extension):
+        self.extension = extension
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        size = len(BSON.encode(event.reply)) if self.extension.count_bytes else 0
+        self._record(event, size)
+
+    def failed(self, event):
+        self._record(event, 0)
+
+    def _record(self, event, size):
+        seconds = event.duration_micros / 1e6
+        self.extension.mongo_commands.inc(event.command_name)
+        self.extension.mongo_duration.observe(seconds, event.command_name)
+        self.extension.mongo_bytes.inc(event.command_name, amount=size)
+        if has_request_context():
+            stats = g.setdefault('mongo_stats', [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += size
+            stats[2] += seconds
+
+
+class Metrics:
+    """Per-endpoint latency histograms, status counts and in-flight gauges, with the MongoDB work of each
+    request, exposed in Prometheus text format at /metrics to scrapers sending METRICS_TOKEN as a bearer token."""
+
+    def __init__(self, app=None):
+        self.registry = Registry()
+        self.count_bytes = False
+        self.server_timing = False
+        self.token = None
+        self.listener = None
+        register = self.registry.register
+        labels = ('endpoint', 'method')
+        self.latency = register(Histogram('http_request_duration_seconds', 'Request latency.', labels))
+        self.requests = register(Counter('http_requests_total', 'Requests by status.', labels + ('status',)))
+        self.in_flight = register(Gauge('http_requests_in_flight', 'Requests being served.', labels))
+        self.request_commands = register(Histogram('http_request_mongo_commands', 'MongoDB commands per request.',
+                                                   labels, buckets=COUNT_BUCKETS))
+        self.request_mongo_seconds = register(Histogram('http_request_mongo_seconds', 'MongoDB time per request.',
+                                                        labels))
+        self.request_mongo_bytes = register(Counter('http_request_mongo_reply_bytes_total',
+                                                    'MongoDB reply bytes by endpoint.', labels))
+        self.mongo_commands = register(Counter('mongo_commands_total', 'MongoDB commands.', ('command',)))
+        self.mongo_duration = register(Histogram('mongo_command_duration_seconds', 'MongoDB command latency.',
+                                                 ('command',)))
+        self.mongo_bytes = register(Counter('mongo_reply_bytes_total', 'MongoDB reply bytes.', ('command',)))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Must run before the MongoDB client is created, so the command listener sees its commands."""
+        if not app.config['METRICS_ENABLED']:
+            return
+        self.count_bytes = app.config['METRICS_MONGO_BYTES']
+        self.server_timing = app.config['METRICS_SERVER_TIMING']
+        self.token = app.config['METRICS_TOKEN']
+        if self.listener is None:
+            self.listener = CommandMetrics(self)
+            monitoring.register(self.listener)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if self.token:
+            app.add_url_rule('/metrics', 'metrics', self.render)
+
+    def render(self):
+        authorization = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(authorization, ('Bearer ' + self.token).encode()):
+            abort(401)
+        return Response(self.registry.render(), mimetype='text/plain; version=0.0.4')
+
+    @staticmethod
+    def _labels():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched', request.method
+
+    def _before_request(self):
+        g.metrics_started_at = time.perf_counter()
+        self.in_flight.inc(*self._labels())
+
+    def _after_request(self, response):
+        self._record(response.status_code)
+        if not self.server_timing:
+            return response
+        commands, size, mongo_seconds = g.get('mongo_stats', (0, 0, 0.0))
+        response.headers['Server-Timing'] = 'app;dur={:.2f}, db;dur={:.2f};desc="{} queries"'.format(
+            (g.metrics_duration - mongo_seconds) * 1000, mongo_seconds * 1000, commands)
+        return response
+
+    def _teardown_request(self, exc):
+        if 'metrics_started_at' not in g:
+            return
+        if 'metrics_duration' not in g:
+            self._record(500)
+        self.in_flight.dec(*self._labels())
+
+    def _record(self, status):
+        labels = self._labels()
+        g.metrics_duration = time.perf_counter() - g.metrics_started_at
+        commands, size, mongo_seconds = g.get('mongo_stats', (0, 0, 0.0))
+        self.latency.observe(g.metrics_duration, *labels)
+        self.requests.inc(*labels, str(status))
+        self.request_commands.observe(commands, *labels)
+        self.request_mongo_seconds.observe(mongo_seconds, *labels)
+        self.request_mongo_bytes.inc(*labels, amount=size)
@@ -1,19 +1,83 @@
-from . import mongo
+from . import mongo, hasher
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask import abort
+from flask import abort, current_app
+from pymongo import UpdateOne
 from bson.objectid import ObjectId
+from bson import DBRef
+from mongoengine.queryset.visitor import Q
+import itertools
+from .prefetch import count_dereference
+from .reads import QuerySet
 
 
-class Follow(mongo.DynamicEmbeddedDocument):
-    id = mongo.ObjectIdField(primary_key=True, default=ObjectId)
-    timestamp = mongo.DateTimeField(default=datetime.utcnow())
-    follower = mongo.ReferenceField('User')
+# Collation of the username/email indexes, so case-insensitive lookups are index equality matches.
+CASE_INSENSITIVE = {'locale': 'en', 'strength': 2}
+
+
+def version_bump():
+    """Update arguments that move a document's version and updated_at forward, so its ETag and Last-Modified
+    change. Every write path to a Post or User includes them."""
+    return dict(inc__version=1, set__updated_at=datetime.utcnow())
+
+
+class ReferenceField(mongo.ReferenceField):
+    """ReferenceField that counts lazy dereferences on the request, so N+1 query patterns show up. A reference
+    to a document that was moved to an archive collection reads as None."""
+
+    def __get__(self, instance, owner):
+        if instance is not None and isinstance(instance._data.get(self.name), DBRef):
+            count_dereference()
+            try:
+                return super(ReferenceField, self).__get__(instance, owner)
+            except mongo.DoesNotExist:
+                return None
+        return super(ReferenceField, self).__get__(instance, owner)
+
+
+class Follow(mongo.Document):
+    follower = ReferenceField('User', required=True)
+    followee = ReferenceField('User', required=True)
+    timestamp = mongo.DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'queryset_class': QuerySet,
+        'index_background': True,
+        'indexes': [
+            {'fields': ['follower', 'followee'], 'unique': True},
+            ('followee', '-timestamp'),
+            ('follower', '-timestamp'),
+        ]
+    }
 
     @staticmethod
-    def find_follower_by_id(user_id=None, follower_id=None):
-        if ObjectId.is_valid(user_id) and ObjectId.is_valid(follower_id):
-            return User.objects(id=user_id, followers__match={"id": follower_id}).first_or_404()
+    def follow(follower_id, followee_id):
+        """Upsert the edge and bump both counters, without reading either user. Returns False if it existed."""
+        try:
+            result = Follow.objects(follower=follower_id, followee=followee_id).update_one(
+                upsert=True, full_result=True, set_on_insert__timestamp=datetime.utcnow())
+        except mongo.NotUniqueError:
+            return False
+        if result.upserted_id is None:
+            return False
+
+        User.objects(id=follower_id).update_one(inc__followings_count=1)
+        User.objects(id=followee_id).update_one(inc__followers_count=1)
+        return True
+
+    @staticmethod
+    def unfollow(follower_id, followee_id):
+        """Delete the edge and decrement both counters, without reading either user. Returns False if it was missing."""
+        if not Follow.objects(follower=follower_id, followee=followee_id).delete():
+            return False
+
+        User.objects(id=follower_id).update_one(dec__followings_count=1)
+        User.objects(id=followee_id).update_one(dec__followers_count=1)
+        return True
+
+    @staticmethod
+    def find_follow(follower_id=None, followee_id=None):
+        if ObjectId.is_valid(follower_id) and ObjectId.is_valid(followee_id):
+            return Follow.objects(follower=follower_id, followee=followee_id).first_or_404()
 
         abort(404)
 
@@ -22,8 +86,8 @@ class Comment(mongo.DynamicEmbeddedDocument):
     id = mongo.ObjectIdField(primary_key=True, default=ObjectId)
     body = mongo.StringField()
     disabled = mongo.BooleanField(default=False)
-    timestamp = mongo.DateTimeField(default=datetime.utcnow())
-    author = mongo.ReferenceField('User')
+    timestamp = mongo.DateTimeField(default=datetime.utcnow)
+    author = ReferenceField('User')
 
     @staticmethod
     def find_comment_by_id(post_id=None, comment_id=None):
@@ -37,11 +101,26 @@ class Post(mongo.DynamicDocument):
     image_url = mongo.StringField(default=None)
     title = mongo.StringField()
     body = mongo.StringField()
-    timestamp = mongo.DateTimeField(default=datetime.utcnow())
+    timestamp = mongo.DateTimeField(default=datetime.utcnow)
     deleted_at = mongo.DateTimeField(default=None)
-    author = mongo.ReferenceField('User')
+    updated_at = mongo.DateTimeField(default=datetime.utcnow)
+    version = mongo.IntField(default=0)
+    author = ReferenceField('User')
     comments = mongo.EmbeddedDocumentListField('Comment')
 
+    meta = {
+        'queryset_class': QuerySet,
+        'index_background': True,
+        'indexes': [
+            {'fields': ['-timestamp', '-id'], 'partialFilterExpression': {'deleted_at': None}},
+            {'fields': ['author', '-timestamp'], 'partialFilterExpression': {'deleted_at': None}},
+            'comments.id',
+            {'fields': ['deleted_at'], 'partialFilterExpression': {'deleted_at': {'$type': 'date'}}},
+            {'fields': ['$title', '$body', '$comments.body'], 'name': 'post_text', 'default_language': 'english',
+             'weights': {'title': 10, 'body': 3, 'comments.body': 1}},
+        ]
+    }
+
     def is_author(self, author):
         return self.author == author
 
@@ -53,6 +132,80 @@ class Post(mongo.DynamicDocument):
         abort(404)
 
 
+class TimelineEntry(mongo.EmbeddedDocument):
+    post = ReferenceField('Post')
+    timestamp = mongo.DateTimeField()
+
+
+class Timeline(mongo.Document):
+    """A user's home timeline, capped to TIMELINE_LENGTH entries, newest first. The _id is the owner's id."""
+    id = mongo.ObjectIdField(primary_key=True)
+    entries = mongo.EmbeddedDocumentListField('TimelineEntry')
+
+    meta = {'queryset_class': QuerySet}
+
+    @staticmethod
+    def fan_out(author, posts):
+        """Push new posts onto the timelines of their author and, unless the author has more than
+        TIMELINE_FANOUT_LIMIT followers, of every follower. Larger accounts are pulled on read instead."""
+        config = current_app.config
+        entries = [{'post': post.id, 'timestamp': post.timestamp} for post in posts]
+        push = {'$push': {'entries': {'$each': entries, '$sort': {'timestamp': -1, 'post': -1},
+                                      '$slice': config['TIMELINE_LENGTH']}}}
+
+        owners = [author.id]
+        if author.followers_count <= config['TIMELINE_FANOUT_LIMIT']:
+            owners = itertools.chain(owners, (follow['follower'] for follow in
+                                              Follow.objects(followee=author.id).only('follower').as_pymongo()))
+
+        collection = Timeline._get_collection()
+        operations = []
+        for owner in owners:
+            operations.append(UpdateOne({'_id': owner}, push, upsert=True))
+            if len(operations) >= config['TIMELINE_FANOUT_BATCH']:
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def read(user_id, before=None, limit=10):
+        """Entries of a user's timeline older than the (timestamp, post id) pair ``before``, newest first."""
+        entries = '$entries'
+        if before is not None:
+            timestamp, post_id = before
+            entries = {'$filter': {'input': '$entries', 'as': 'entry', 'cond': {'$or': [
+                {'$lt': ['$$entry.timestamp', timestamp]},
+                {'$and': [{'$eq': ['$$entry.timestamp', timestamp]}, {'$lt': ['$$entry.post', post_id]}]},
+            ]}}}
+        timelines = Timeline.objects(id=user_id).aggregate({'$project': {'entries': {'$slice': [entries, limit]}}})
+        timeline = next(iter(timelines), None)
+        return [(entry['timestamp'], entry['post']) for entry in (timeline or {}).get('entries') or []]
+
+    @staticmethod
+    def pulled_followees(user_id):
+        """Ids of the accounts a user follows that are too large to fan out, whose posts are pulled on read."""
+        celebrities = [user['_id'] for user in User.objects(
+            followers_count__gt=current_app.config['TIMELINE_FANOUT_LIMIT']).only('id').as_pymongo()]
+        if not celebrities:
+            return []
+        return [follow['followee'] for follow in Follow.objects(
+            follower=user_id, followee__in=celebrities).only('followee').as_pymongo()]
+
+    @staticmethod
+    def pull(followees, before=None, limit=10):
+        """(timestamp, post id) pairs of the newest live posts by ``followees``, see pulled_followees."""
+        if not followees:
+            return []
+
+        posts = Post.objects(author__in=followees, deleted_at=None)
+        if before is not None:
+            timestamp, post_id = before
+            posts = posts.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=post_id))
+        posts = posts.order_by('-timestamp', '-id').limit(limit).only('id', 'timestamp').as_pymongo()
+        return [(post['timestamp'], post['_id']) for post in posts]
+
+
 class Role(mongo.DynamicEmbeddedDocument):
     name = mongo.StringField()
     default = mongo.BooleanField(default=False)
@@ -78,6 +231,10 @@ class Role(mongo.DynamicEmbeddedDocument):
     def has_permission(self, perm):
         return self.permissions & perm == perm
 
+    @staticmethod
+    def default_role():
+        return Role(name='User', default=True, permissions=Permission.FOLLOW | Permission.COMMENT | Permission.WRITE)
+
 
 class Permission:
     FOLLOW = 1
@@ -88,8 +245,8 @@ class Permission:
 
 
 class User(mongo.DynamicDocument):
-    username = mongo.StringField(unique=True)
-    email = mongo.StringField(unique=True)
+    username = mongo.StringField()
+    email = mongo.StringField()
     enabled = mongo.BooleanField()
     first_name = mongo.StringField()
     last_name = mongo.StringField()
@@ -103,23 +260,47 @@ class User(mongo.DynamicDocument):
     hashed_password = mongo.StringField()
     confirmed = mongo.BooleanField(default=False)
     deleted_at = mongo.DateTimeField(default=None)
+    updated_at = mongo.DateTimeField(default=datetime.utcnow)
+    version = mongo.IntField(default=0)
+    role_version = mongo.IntField(default=0)  # incremented with every change to roles, revokes older tokens
     roles = mongo.EmbeddedDocumentListField("Role")
-    followings = mongo.EmbeddedDocumentListField("Follow")
-    followers = mongo.EmbeddedDocumentListField("Follow")
-
-    def is_following(self, follower):
-        return self.followings.filter(follower=follower).first() is not None
-
-    def is_followed(self, followed):
-        return self.followers.filter(follower=followed).first() is not None
+    followings_count = mongo.IntField(default=0)
+    followers_count = mongo.IntField(default=0)
+
+    meta = {
+        'queryset_class': QuerySet,
+        'index_background': True,
+        'indexes': [
+            {'fields': ['-member_since', '-id'], 'partialFilterExpression': {'deleted_at': None}},
+            {'fields': ['followers_count'], 'partialFilterExpression': {'followers_count': {'$gt': 1000}}},
+            {'fields': ['updated_at'], 'partialFilterExpression': {'role_version': {'$gt': 0}}},
+            {'fields': ['deleted_at'], 'partialFilterExpression': {'deleted_at': {'$type': 'date'}}},
+            {'fields': ['username'], 'name': 'username_ci', 'unique': True, 'collation': CASE_INSENSITIVE},
+            {'fields': ['email'], 'name': 'email_ci', 'unique': True, 'collation': CASE_INSENSITIVE},
+        ]
+    }
+
+    def is_following(self, user):
+        return Follow.objects(follower=self, followee=user).only('id').first() is not None
+
+    def is_followed(self, user):
+        return Follow.objects(follower=user, followee=self).only('id').first() is not None
 
     def full_name(self):
         return "{first_name} {last_name}".format(first_name=self.first_name, last_name=self.last_name)
 
     def __init__(self, **kwargs):
+        # plaintext left behind by older releases, see `flask scrub-passwords`
+        kwargs.pop('password', None)
         super(User, self).__init__(**kwargs)
-        if self.role is None:
-            self.role = Role.query.filter_by(default=True).first()
+        if self._created and not self.roles:
+            self.roles = [Role.default_role()]
+
+    def __setattr__(self, name, value):
+        # password is a write-only property, not a dynamic field to be stored in plaintext
+        if name == 'password':
+            return object.__setattr__(self, name, value)
+        super(User, self).__setattr__(name, value)
 
     @property
     def password(self):
@@ -127,10 +308,10 @@ class User(mongo.DynamicDocument):
 
     @password.setter
     def password(self, password):
-        self.hashed_password = generate_password_hash(password)
+        self.hashed_password = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.hashed_password, password)
+        return self.hashed_password is not None and hasher.verify(self.hashed_password, password)
 
     def can(self, perm):
         for role in self.roles:
@@ -138,6 +319,20 @@ class User(mongo.DynamicDocument):
                 return True
         return False
 
+    def permission_mask(self):
+        mask = 0
+        for role in self.roles:
+            mask |= role.permissions
+        return mask
+
+    def token_claims(self):
+        """Claims of the tokens issued to this user, so permission checks need no database lookup."""
+        # role_version reads as None on users stored before it existed, when loaded with only()
+        return {'perms': self.permission_mask(), 'rv': self.role_version or 0}
+
+    def set_roles(self, roles):
+        self.update(set__roles=roles, inc__role_version=1, **version_bump())
+
     def is_administrator(self):
         return self.can(Permission.ADMIN)
 
@@ -0,0 +1,67 @@
+from flask import g, has_app_context
+from marshmallow.fields import Nested
+from mongoengine.fields import EmbeddedDocumentField, ReferenceField
+from bson import DBRef
+
+
+def count_dereference(queries=1):
+    if has_app_context():
+        g.dereference_count = g.get('dereference_count', 0) + queries
+
+
+def get_dereference_count():
+    return g.get('dereference_count', 0)
+
+
+def schema_fields(schema, document_type, *extra):
+    """Names of the document fields a schema dumps, plus ``extra``, usable as an .only() projection. Embedded
+    documents the schema nests are narrowed to the fields of the nested schema as dotted paths; references are
+    kept whole, prefetch_references projects the documents they point to."""
+    fields = list(extra)
+    for name, field in schema.dump_fields.items():
+        attribute = field.attribute or name
+        document_field = document_type._fields.get(attribute)
+        if document_field is None:
+            continue
+        # embedded lists wrap their EmbeddedDocumentField
+        embedded = getattr(document_field, 'field', None) or document_field
+        if isinstance(field, Nested) and isinstance(embedded, EmbeddedDocumentField):
+            fields += ['{}.{}'.format(attribute, path) for path in schema_fields(field.schema, embedded.document_type)]
+        else:
+            fields.append(attribute)
+    return fields
+
+
+def schema_projection(schema, document_type, *extra):
+    """schema_fields as a raw MongoDB projection, for aggregations."""
+    return {document_type._translate_field_name(path): 1 for path in schema_fields(schema, document_type, *extra)}
+
+
+def prefetch_references(documents, schema, *extra):
+    """Resolve every reference the schema dumps as a Nested field with one $in query per field, instead of
+    letting each document dereference lazily while it is serialized. The referenced documents also load the
+    ``extra`` fields."""
+    documents = [document for document in documents if document is not None]
+    if not documents:
+        return documents
+
+    document_type = type(documents[0])
+    for name, field in schema.dump_fields.items():
+        attribute = field.attribute or name
+        if not isinstance(field, Nested) or not isinstance(document_type._fields.get(attribute), ReferenceField):
+            continue
+
+        refs = [document._data.get(attribute) for document in documents]
+        ids = {ref.id for ref in refs if isinstance(ref, DBRef)}
+        if not ids:
+            continue
+
+        reference_type = document_type._fields[attribute].document_type
+        only = schema_fields(field.schema, reference_type, *extra)
+        references = {reference.id: reference for reference in reference_type.objects(id__in=ids).only(*only)}
+        count_dereference()
+
+        for document, ref in zip(documents, refs):
+            if isinstance(ref, DBRef) and ref.id in references:
+                document._data[attribute] = references[ref.id]
+    return documents
@@ -0,0 +1,106 @@
+from collections import Counter
+from threading import Event, Thread, get_ident
+import hmac
+import os
+import random
+import sys
+import time
+from flask import current_app, g, request
+from .hashing import gevent_patched
+
+
+class StackSampler:
+    """Samples the call stack of one thread from a background thread, every ``interval`` seconds."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+def summarize(stacks, restrictions):
+    """Text report of the functions with the most samples, on their own and including callees."""
+    total = sum(stacks.values())
+    own, cumulative = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            cumulative[frame] += count
+
+    lines = ['{} samples'.format(total), '', '{:>7} {:>7}  function'.format('own%', 'cum%')]
+    for frame, count in own.most_common(restrictions):
+        lines.append('{:>6.1f}% {:>6.1f}%  {}'.format(count * 100.0 / total, cumulative[frame] * 100.0 / total, frame))
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """Profiles one request in PROFILER_SAMPLE_RATE, plus any request whose X-Profile header carries
+    PROFILER_TOKEN, with a sampling profiler. Each profile is written to PROFILER_DIR as a collapsed-stack
+    file for flamegraph tools, next to a text summary of the top PROFILER_NUM_FUNCTION_RESTRICTIONS functions.
+    Requests that are not profiled only pay for a random draw."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['PROFILER_SAMPLE_RATE'] and not app.config['PROFILER_TOKEN']:
+            return
+        if gevent_patched():
+            # the sampler would be a greenlet that cannot interrupt the request, and get_ident() a greenlet id
+            # missing from sys._current_frames(), so every profile would come out empty
+            app.logger.warning('The request profiler does not support gevent workers and is disabled.')
+            return
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def _before_request():
+        config = current_app.config
+        rate, token = config['PROFILER_SAMPLE_RATE'], config['PROFILER_TOKEN']
+        if (rate and random.random() * rate < 1) or (token and hmac.compare_digest(
+                request.headers.get('X-Profile', '').encode(), token.encode())):
+            g.stack_sampler = StackSampler(get_ident(), config['PROFILER_INTERVAL']).start()
+            g.stack_sampler_started_at = time.time()
+
+    @staticmethod
+    def _teardown_request(exc):
+        sampler = g.pop('stack_sampler', None)
+        if sampler is None:
+            return
+        stacks = sampler.stop()
+        config = current_app.config
+        endpoint = '{}.{}'.format(request.endpoint or 'unmatched', request.method)
+        summary = summarize(stacks, config['PROFILER_NUM_FUNCTION_RESTRICTIONS'])
+        if not config['PROFILER_DIR']:
+            current_app.logger.info('Profile of %s %s\n%s', request.method, request.path, summary)
+            return
+
+        name = os.path.join(config['PROFILER_DIR'], '{}.{:.0f}'.format(endpoint, g.stack_sampler_started_at * 1000))
+        with open(name + '.folded', 'w') as folded:
+            folded.writelines('{} {}\n'.format(stack, count) for stack, count in stacks.items())
+        with open(name + '.txt', 'w') as text:
+            text.write('{} {}\n{}'.format(request.method, request.full_path, summary))
@@ -0,0 +1,93 @@
+import time
+from flask import current_app, g, has_app_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_mongoengine import BaseQuerySet
+from pymongo.read_preferences import SecondaryPreferred
+from .cache import TTLCache
+from .prefetch import schema_fields
+
+READ_PRIMARY_COOKIE = 'read_primary_until'
+
+
+class QuerySet(BaseQuerySet):
+    """Queryset of every document: applies MONGO_MAX_TIME_MS to its queries, and the read preference the
+    current request opted into with ``secondary_reads``."""
+
+    def __init__(self, document, collection):
+        super(QuerySet, self).__init__(document, collection)
+        self._collation = None
+        if has_app_context():
+            self._max_time_ms = current_app.config['MONGO_MAX_TIME_MS'] or None
+            self._read_preference = g.get('read_preference')
+
+    def collation(self, collation=None):
+        """Compare strings with ``collation``, so the query can use the index declared with it. MongoEngine
+        0.18 has no collation support of its own."""
+        queryset = self.clone()
+        queryset._collation = collation
+        return queryset
+
+    def _clone_into(self, new_qs):
+        new_qs = super(QuerySet, self)._clone_into(new_qs)
+        new_qs._collation = self._collation
+        return new_qs
+
+    @property
+    def _cursor_args(self):
+        cursor_args = super(QuerySet, self)._cursor_args
+        if self._collation is not None:
+            cursor_args['collation'] = self._collation
+        return cursor_args
+
+    def project(self, schema, *extra):
+        """Load only the fields the response schema dumps, plus ``extra`` fields the view reads itself.
+        Documents loaded this way hold defaults in every other field, so they must not be saved."""
+        if has_app_context() and not current_app.config['SCHEMA_PROJECTIONS']:
+            return self.clone()
+        return self.only(*schema_fields(schema, self._document, *extra))
+
+
+class ReplicaReads:
+    """Routes the reads of opted-in GET handlers to a secondary no staler than MONGO_MAX_STALENESS_SECONDS.
+
+    A user who wrote within that bound (plus a heartbeat) reads from the primary, so authors see their own
+    writes. Writers are remembered in this process and in a cookie, for clients that reach another process.
+    """
+
+    HEARTBEAT_SECONDS = 10
+
+    def __init__(self, app=None):
+        self.read_preference = None
+        self.window = 0
+        self.writers = TTLCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config['MONGO_SECONDARY_READS']:
+            return
+        self.read_preference = SecondaryPreferred(max_staleness=app.config['MONGO_MAX_STALENESS_SECONDS'])
+        self.window = app.config['MONGO_MAX_STALENESS_SECONDS'] + self.HEARTBEAT_SECONDS
+        self.writers.configure(app.config['MONGO_RECENT_WRITERS_SIZE'], self.window)
+        app.after_request(self._after_request)
+
+    def route(self):
+        """Read the rest of the current request from a secondary, unless its user wrote recently."""
+        if self.read_preference is None:
+            return
+        identity = get_jwt_identity()
+        if identity is not None and self.writers.get(identity) is not None:
+            return
+        if request.cookies.get(READ_PRIMARY_COOKIE, type=float, default=0) > time.time():
+            return
+        g.read_preference = self.read_preference
+
+    def _after_request(self, response):
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or response.status_code >= 400:
+            return response
+        identity = get_jwt_identity()
+        if identity is not None:
+            self.writers.set(identity, True)
+            response.set_cookie(READ_PRIMARY_COOKIE, str(int(time.time()) + self.window), max_age=self.window,
+                                httponly=True)
+        return response
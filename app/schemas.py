@@ -1,7 +1,21 @@
+from functools import reduce
+import operator
 from . import ma
 from marshmallow import validates_schema, ValidationError
 from marshmallow.validate import Length, Email
-from .models import User, Post, Comment
+from mongoengine.queryset.visitor import Q
+from .models import User, Post, Comment, CASE_INSENSITIVE
+
+
+# Fields backed by a case-insensitive unique index, with the error reported for a taken value.
+UNIQUE_FIELDS = {'email': 'Email already exist.', 'username': 'Username already exist.'}
+
+
+def duplicate_key_errors(error):
+    """Validation messages for a duplicate key error raised by a write that lost a race to the unique index."""
+    message = str(error)
+    return {field: [text] for field, text in UNIQUE_FIELDS.items() if 'index: {}_ci '.format(field) in message} \
+        or {'_schema': ['Duplicate value.']}
 
 
 class UserSchema(ma.Schema):
@@ -26,19 +40,20 @@ class UserSchema(ma.Schema):
 
     @validates_schema
     def validate_unique_fields(self, data, **kwargs):
-        errors = {}
-
-        user = User.objects(email__iexact=data['email']).first() if data.get('user_id', None) is None else \
-            User.objects(email__iexact=data['email'], id__ne=data['user_id']).first()
-        if user is not None:
-            errors['email'] = ["Email already exist."]
-            print(user.id, data.get('id', None))
-
-        user = User.objects(username__iexact=data['username']).first() if data.get('user_id', None) is None else \
-            User.objects(username__iexact=data['username'], id__ne=data['user_id']).first()
-        if user is not None:
-            errors['username'] = ["Username already exist."]
+        # one $or over the case-insensitive unique indexes, reporting both conflicts; the indexes still
+        # settle races between concurrent requests, see duplicate_key_errors
+        fields = [field for field in UNIQUE_FIELDS if data.get(field)]
+        if not fields:
+            return
+        users = User.objects(reduce(operator.or_, (Q(**{field: data[field]}) for field in fields)))
+        if data.get('user_id') is not None:
+            users = users.filter(id__ne=data['user_id'])
 
+        errors = {}
+        for user in users.collation(CASE_INSENSITIVE).only(*fields).limit(len(fields)).as_pymongo():
+            for field in fields:
+                if (user.get(field) or '').casefold() == data[field].casefold():
+                    errors[field] = [UNIQUE_FIELDS[field]]
         if errors:
             raise ValidationError(errors)
 
@@ -73,4 +88,19 @@ class PostSchema(ma.Schema):
 class FollowSchema(ma.Schema):
     id = ma.String(dump_only=True)
     timestamp = ma.DateTime(format='%Y-%m-%dT%H:%M:%S%z')
-    follower = ma.Nested(UserSchema)
\ No newline at end of file
+    follower = ma.Nested(UserSchema)
+    followee = ma.Nested(UserSchema)
+
+
+# Schemas hold no per-request state once built, so views share these instances instead of building new ones
+# for every request.
+user_schema = UserSchema()
+users_schema = UserSchema(many=True)
+post_schema = PostSchema()
+posts_schema = PostSchema(many=True)
+comment_schema = CommentSchema()
+comments_schema = CommentSchema(many=True)
+follower_schema = FollowSchema(exclude=('followee',))
+followers_schema = FollowSchema(many=True, exclude=('followee',))
+following_schema = FollowSchema(exclude=('follower',))
+followings_schema = FollowSchema(many=True, exclude=('follower',))
@@ -0,0 +1,77 @@
+from flask import current_app
+from marshmallow import fields, missing
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+
+
+def _string(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+def _boolean(field):
+    truthy, falsy = field.truthy, field.falsy
+    return lambda value: True if value in truthy else False if value in falsy else bool(value)
+
+
+def _datetime(field):
+    data_format = field.format
+    return lambda value: value.strftime(data_format)
+
+
+def _fast_formatter(field):
+    """Formatter equivalent to ``field._serialize`` for plain fields read straight off the object, or None."""
+    if field.default is not missing or not field._CHECK_ATTRIBUTE:
+        return None
+    if type(field) is fields.Nested and not field.many and not field.schema.many:
+        return compile_dump(field.schema)
+    if type(field) is fields.String:
+        return _string
+    if type(field) is fields.Boolean:
+        return _boolean(field)
+    if type(field) is fields.DateTime and field.format and field.format not in field.SERIALIZATION_FUNCS:
+        return _datetime(field)
+    return None
+
+
+def compile_dump(schema):
+    """Generate a function equivalent to ``schema.dump`` for documents.
+
+    Plain string, boolean and formatted datetime fields are inlined as attribute reads and nested schemas are
+    compiled recursively; every other field (hyperlinks, ...) still goes through its own ``serialize``.
+    Schemas with dump processors are not compiled.
+    """
+    if schema._has_processors(PRE_DUMP) or schema._has_processors(POST_DUMP):
+        return schema.dump
+
+    namespace = {'missing': missing, 'accessor': schema.get_attribute}
+    lines = ['def dump_one(obj):', '    ret = {}']
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else name
+        formatter = _fast_formatter(field)
+        if formatter is not None:
+            namespace['format_%d' % index] = formatter
+            lines += ['    value = getattr(obj, %r, missing)' % (field.attribute or name),
+                      '    if value is not missing:',
+                      '        ret[%r] = None if value is None else format_%d(value)' % (key, index)]
+        else:
+            namespace['serialize_%d' % index] = field.serialize
+            lines += ['    value = serialize_%d(%r, obj, accessor=accessor)' % (index, name),
+                      '    if value is not missing:',
+                      '        ret[%r] = value' % key]
+    lines.append('    return ret')
+    exec('\n'.join(lines), namespace)
+
+    dump_one = namespace['dump_one']
+    if schema.many:
+        return lambda objs: [dump_one(obj) for obj in objs]
+    return dump_one
+
+
+def dump(schema, obj):
+    """Dump with the schema's compiled function when PRECOMPILED_SERIALIZERS is enabled."""
+    if not current_app.config['PRECOMPILED_SERIALIZERS']:
+        return schema.dump(obj)
+
+    compiled = schema.__dict__.get('_compiled_dump')
+    if compiled is None:
+        compiled = schema._compiled_dump = compile_dump(schema)
+    return compiled(obj)
@@ -1,13 +1,210 @@
-from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended import get_jwt_identity, get_jwt_claims
+from flask import abort, request, current_app, g
+from werkzeug.http import http_date
+from mongoengine.queryset.visitor import Q
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+import base64
+import hashlib
 from .models import User
+from . import user_cache, role_versions
 
 
-def has_permissions(user, *perms):
+EPOCH = datetime(1970, 1, 1)
+
+
+def has_permissions(mask, *perms):
     for perm in perms:
-        if user.can(perm):
+        if mask & perm == perm:
             return True
     return False
 
 
+def get_current_permissions():
+    """Permission bitmask of the request's token, read from its claims unless the user's roles changed since it
+    was issued. Tokens issued without claims fall back to loading the user."""
+    claims = get_jwt_claims()
+    if 'perms' not in claims:
+        user = get_current_user()
+        return user.permission_mask() if user is not None else 0
+    if not role_versions.allows(get_jwt_identity(), claims['rv']):
+        return 0
+    return claims['perms']
+
+
 def get_current_user():
-    return User.objects(id=get_jwt_identity(), delete_at=None).first() if get_jwt_identity() is not None else None
\ No newline at end of file
+    """Resolve the authenticated user once per request, from the process cache when it is enabled."""
+    if 'current_user' not in g:
+        identity = get_jwt_identity()
+        user = user_cache.get(identity) if identity is not None else None
+        if user is None and identity is not None:
+            user = User.objects(id=identity, deleted_at=None).first()
+            if user is not None:
+                user_cache.set(identity, user)
+        g.current_user = user
+    return g.current_user
+
+
+def get_page_args():
+    page = max(request.args.get('page', type=int, default=1), 1)
+    item_per_page = request.args.get('item_per_page', type=int, default=10)
+    return page, min(max(item_per_page, 1), current_app.config['MAX_ITEM_PER_PAGE'])
+
+
+def slice_embedded_list(queryset, field, offset, limit, include=()):
+    """Load a window of an embedded list with a $slice projection, so only that window, the parent's _id and the
+    included parent fields leave MongoDB. Returns the raw parent and the window, or (None, None) when no parent
+    document matches."""
+    return embedded_list_window(queryset, field, {'$slice': ['$' + field, offset, limit]}, include)
+
+
+def embedded_list_window(queryset, field, elements, include=()):
+    """slice_embedded_list for any expression selecting the elements of ``field``, such as a $filter."""
+    projection = {name: 1 for name in include}
+    projection[field] = elements
+    parent = next(iter(queryset.aggregate({'$project': projection})), None)
+    if parent is None:
+        return None, None
+    document_type = queryset._document._fields[field].field.document_type
+    return parent, [document_type._from_son(item) for item in parent.get(field) or []]
+
+
+# Fields version_headers reads, for views that load a projection of the document.
+VERSION_FIELDS = ('version', 'updated_at')
+# last_seen is written behind without a version bump, so validators covering a user read it as well.
+USER_VERSION_FIELDS = VERSION_FIELDS + ('last_seen',)
+
+
+def document_version(document):
+    """Version tag and last modification time of a document or its raw version projection. A loaded last_seen
+    is part of both, since it is written behind without a version bump (see ActivityTracker)."""
+    if isinstance(document, dict):
+        object_id, version = document['_id'], document.get('version')
+        updated_at, last_seen = document.get('updated_at'), document.get('last_seen')
+    else:
+        object_id, version = document.id, document.version
+        updated_at, last_seen = document.updated_at, document._data.get('last_seen')
+    tag = '{}.{}'.format(object_id, version or 0)
+    if last_seen is not None:
+        tag += '.{}'.format((last_seen - EPOCH) // timedelta(milliseconds=1))
+        updated_at = max(updated_at, last_seen) if updated_at is not None else last_seen
+    return tag, updated_at
+
+
+def version_headers(document, related=()):
+    """Strong ETag and Last-Modified for a Post or User, from a document or its raw version projection.
+
+    ``related`` are the users the representation embeds (the authors of a post or of its comments), loaded with
+    USER_VERSION_FIELDS; their versions are folded into the ETag, so editing an author or a newer last_seen
+    changes it."""
+    tag, updated_at = document_version(document)
+    related = [document_version(user) for user in related if user is not None]
+    if related:
+        tag += '.' + hashlib.sha1(','.join(sorted({user_tag for user_tag, _ in related})).encode()).hexdigest()[:12]
+
+    headers = {'ETag': '"{}"'.format(tag)}
+    modified = [timestamp for timestamp in [updated_at] + [timestamp for _, timestamp in related]
+                if timestamp is not None]
+    if modified:
+        headers['Last-Modified'] = http_date(max(modified))
+    return headers
+
+
+def if_none_match(headers):
+    """A 304 response when If-None-Match matches the ETag of ``headers``, or None."""
+    # weak comparison, compressed responses carry the ETag as W/"..."
+    if request.if_none_match and request.if_none_match.contains_weak(headers['ETag'].strip('"')):
+        return '', 304, headers
+    return None
+
+
+def not_modified(queryset, fields=VERSION_FIELDS, references=()):
+    """Answer If-None-Match from a version-only projection, without loading or dumping the document. The users
+    named by the ``references`` fields are folded in with one more query, like version_headers does.
+    Returns a 304 response, or None when the request has to be served in full."""
+    if not request.if_none_match:
+        return None
+    document = queryset.only(*fields, *references).as_pymongo().first()
+    if document is None:
+        return None
+    return _related_not_modified(document, [document.get(name) for name in references])
+
+
+def embedded_not_modified(queryset, field, elements, reference, fields=VERSION_FIELDS):
+    """not_modified for a window of an embedded list. ``elements`` is the expression selecting the window from
+    ``field`` (a $slice or a $filter); the users its elements name in ``reference`` are folded in. Only the parent's
+    version fields and those ids leave MongoDB."""
+    if not request.if_none_match:
+        return None
+    projection = dict.fromkeys(fields, 1)
+    documents = queryset.aggregate({'$project': {**projection, field: elements}},
+                                   {'$project': {**projection, 'references': '${}.{}'.format(field, reference)}})
+    document = next(iter(documents), None)
+    if document is None:
+        return None
+    return _related_not_modified(document, document.get('references') or [])
+
+
+def _related_not_modified(document, user_ids):
+    ids = {user_id for user_id in user_ids if user_id is not None}
+    related = User.objects(id__in=ids).only(*USER_VERSION_FIELDS).as_pymongo() if ids else []
+    return if_none_match(version_headers(document, related))
+
+
+def paginate_by_page(queryset, page, item_per_page):
+    """Offset pagination that derives has_more from one extra row instead of a count()."""
+    items = list(queryset.skip((page - 1) * item_per_page).limit(item_per_page + 1))
+    if not items and page != 1:
+        abort(404)
+    return items[:item_per_page], len(items) > item_per_page
+
+
+def get_by_ids(queryset):
+    """Load the documents listed in ?ids=a,b,c with one $in query. Returns them in request order, with the ids
+    that matched nothing."""
+    ids = [object_id for object_id in request.args['ids'].split(',') if object_id]
+    if len(ids) > current_app.config['BULK_MAX_ITEMS']:
+        abort(400, 'At most {} ids can be requested at once.'.format(current_app.config['BULK_MAX_ITEMS']))
+
+    found = {str(document.id): document
+             for document in queryset.filter(id__in=[ObjectId(i) for i in ids if ObjectId.is_valid(i)])}
+    return [found[i] for i in ids if i in found], [i for i in ids if i not in found]
+
+
+def encode_cursor(timestamp, object_id):
+    millis = (timestamp - EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode('{}:{}'.format(millis, object_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        millis, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return EPOCH + timedelta(milliseconds=int(millis)), ObjectId(object_id)
+    except (ValueError, OverflowError, InvalidId):
+        abort(400, 'Invalid cursor.')
+
+
+def encode_score_cursor(score, object_id):
+    return base64.urlsafe_b64encode('{!r}:{}'.format(score, object_id).encode()).decode()
+
+
+def decode_score_cursor(cursor):
+    try:
+        score, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(score), ObjectId(object_id)
+    except (ValueError, OverflowError, InvalidId):
+        abort(400, 'Invalid cursor.')
+
+
+def paginate_by_cursor(queryset, cursor, item_per_page, field='timestamp'):
+    """Keyset pagination over (field, _id) in descending order, without count() or skip()."""
+    if cursor:
+        timestamp, object_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{field + '__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': object_id}))
+
+    items = list(queryset.order_by('-' + field, '-id').limit(item_per_page + 1))
+    has_more = len(items) > item_per_page
+    items = items[:item_per_page]
+    next_cursor = encode_cursor(items[-1][field], items[-1].id) if has_more else None
+    return items, has_more, next_cursor
@@ -0,0 +1,330 @@
+"""Latency, throughput and MongoDB queries per request of every route of the ``api`` blueprint.
+
+Seeds the database in MONGO_DB (a local mongod, or mongomock://localhost for a dry run) with a synthetic
+dataset, then replays the same shuffled request plan either in-process through the Flask test client or over
+HTTP against a threaded WSGI server with several client threads:
+
+    $ MONGO_DB=mongodb://localhost:27017/blog_bench python -m benchmarks.api --mode wsgi --threads 8 -o head.json
+    $ python -m benchmarks.compare base.json head.json
+
+Queries per request are read from the Server-Timing header, so they stay 0 under mongomock, which does not
+publish command monitoring events. Routes the plan has no request for are listed under "skipped".
+"""
+import argparse
+import http.client
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from itertools import count
+from threading import Lock, Thread
+from urllib.parse import urlencode
+from bson import ObjectId
+from flask_jwt_extended import create_refresh_token
+from werkzeug.serving import make_server
+from app import create_app
+from app.models import Post, User
+from .dataset import Dataset, PASSWORD, access_token
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Plan:
+    """Builds requests for the routes of the api blueprint from the seeded dataset.
+
+    Documents removed by DELETE requests are inserted while the plan is built, so every request finds its
+    target and the timed part of the run only measures the API.
+    """
+
+    def __init__(self, dataset, rng):
+        self.data = dataset
+        self.rng = rng
+        self.serial = count()
+        self.admin = dataset.user_ids[0]
+        self.tokens = {}
+        self.refresh_token = create_refresh_token(identity=str(self.admin))
+
+    def auth(self, user_id):
+        token = self.tokens.get(user_id)
+        if token is None:
+            token = self.tokens[user_id] = access_token(user_id)
+        return {'Authorization': 'Bearer ' + token}
+
+    def user(self):
+        return self.rng.choice(self.data.user_ids)
+
+    def post(self):
+        return self.rng.choice(self.data.post_ids)
+
+    def comment(self):
+        post_id = self.rng.choice([post_id for post_id in self.data.post_ids[:100] if self.data.comment_ids[post_id]])
+        return post_id, self.rng.choice(self.data.comment_ids[post_id])
+
+    def edge(self):
+        return self.rng.choice(self.data.edges)
+
+    def new_user(self):
+        serial = next(self.serial)
+        return {'username': 'bench%d' % serial, 'email': 'bench%d@example.com' % serial, 'first_name': 'Bench',
+                'last_name': 'User', 'phone': '0000000000', 'password': PASSWORD}
+
+    def new_post(self):
+        return {'title': self.data.words(6), 'body': self.data.words(self.data.body_size // 6),
+                'image_url': 'http://example.com/bench.png'}
+
+    def spare_user(self):
+        user = self.new_user()
+        del user['password']
+        return User._get_collection().insert_one(user).inserted_id
+
+    def spare_post(self):
+        return Post._get_collection().insert_one(dict(self.new_post(), author=self.user(), comments=[])).inserted_id
+
+    def spare_comment(self):
+        post_id, comment_id = self.post(), ObjectId()
+        Post._get_collection().update_one({'_id': post_id}, {'$push': {'comments': {
+            '_id': comment_id, 'body': self.data.words(20), 'author': self.user(), 'disabled': False}}})
+        return post_id, comment_id
+
+    def build(self, rules, repeat):
+        requests, skipped = [], []
+        for rule, method in rules:
+            factory = ROUTES.get((method, rule))
+            if factory is None:
+                skipped.append('{} {}'.format(method, rule))
+                continue
+            for _ in range(repeat):
+                path, options = factory(self)
+                requests.append(dict(options, route='{} {}'.format(method, rule), method=method, path='/api' + path))
+        self.rng.shuffle(requests)
+        return requests, skipped
+
+
+def _user_get(plan):
+    return '/users/%s' % plan.user(), dict(headers=plan.auth(plan.admin))
+
+
+def _user_put(plan):
+    return '/users/%s' % plan.user(), dict(headers=plan.auth(plan.admin), json={'about_me': plan.data.words(10)})
+
+
+def _comment(plan, method):
+    post_id, comment_id = plan.spare_comment() if method == 'DELETE' else plan.comment()
+    options = dict(headers=plan.auth(plan.admin))
+    if method == 'PUT':
+        options['json'] = {'body': plan.data.words(20)}
+    return '/posts/%s/comments/%s' % (post_id, comment_id), options
+
+
+def _timeline(plan):
+    user_id = plan.user()
+    return '/users/%s/timeline' % user_id, dict(headers=plan.auth(user_id))
+
+
+def _follow(plan, path, edge=None):
+    follower, followee = edge or plan.edge()
+    return path % (followee, follower), dict(headers=plan.auth(follower))
+
+
+ROUTES = {
+    ('POST', '/login'): lambda plan: ('/login', dict(json={'username': 'user%d' % plan.rng.randrange(plan.data.users),
+                                                           'password': PASSWORD})),
+    ('POST', '/token/refresh'): lambda plan: ('/token/refresh', dict(
+        headers={'Authorization': 'Bearer ' + plan.refresh_token})),
+    ('GET', '/users/'): lambda plan: ('/users/', dict(headers=plan.auth(plan.admin), query={'item_per_page': 20})),
+    ('POST', '/users/'): lambda plan: ('/users/', dict(json=plan.new_user())),
+    ('GET', '/users/<string:user_id>'): _user_get,
+    ('PUT', '/users/<string:user_id>'): _user_put,
+    ('DELETE', '/users/<string:user_id>'): lambda plan: ('/users/%s' % plan.spare_user(), dict(
+        headers=plan.auth(plan.admin))),
+    ('GET', '/users/<string:user_id>/timeline'): _timeline,
+    ('GET', '/users/<string:user_id>/followers'): lambda plan: ('/users/%s/followers' % plan.user(), dict(
+        headers=plan.auth(plan.admin))),
+    ('GET', '/users/<string:user_id>/followings'): lambda plan: ('/users/%s/followings' % plan.user(), dict(
+        headers=plan.auth(plan.admin))),
+    ('GET', '/users/<string:user_id>/followers/<string:follower_id>'): lambda plan: _follow(
+        plan, '/users/%s/followers/%s'),
+    # followings/<b> of user a is the edge a -> b
+    ('GET', '/users/<string:user_id>/followings/<string:follower_id>'): lambda plan: _follow(
+        plan, '/users/%s/followings/%s', plan.edge()[::-1]),
+    ('POST', '/users/<string:user_id>/follow/<string:follower_id>'): lambda plan: _follow(
+        plan, '/users/%s/follow/%s', (plan.user(), plan.user())),
+    ('POST', '/users/<string:user_id>/unfollow/<string:follower_id>'): lambda plan: _follow(
+        plan, '/users/%s/unfollow/%s'),
+    ('GET', '/posts/'): lambda plan: ('/posts/', dict(headers=plan.auth(plan.user()), query={'item_per_page': 20})),
+    ('POST', '/posts/'): lambda plan: ('/posts/', dict(headers=plan.auth(plan.user()), json=plan.new_post())),
+    ('POST', '/posts/bulk'): lambda plan: ('/posts/bulk', dict(headers=plan.auth(plan.user()),
+                                                               json=[plan.new_post() for _ in range(10)])),
+    ('GET', '/posts/search'): lambda plan: ('/posts/search', dict(headers=plan.auth(plan.user()),
+                                                                  query={'q': plan.data.words(2)})),
+    ('GET', '/posts/<string:post_id>'): lambda plan: ('/posts/%s' % plan.post(), dict(headers=plan.auth(plan.user()))),
+    ('PUT', '/posts/<string:post_id>'): lambda plan: ('/posts/%s' % plan.post(), dict(
+        headers=plan.auth(plan.admin), json={'title': plan.data.words(6)})),
+    ('DELETE', '/posts/<string:post_id>'): lambda plan: ('/posts/%s' % plan.spare_post(), dict(
+        headers=plan.auth(plan.admin))),
+    ('GET', '/posts/<string:post_id>/comments'): lambda plan: ('/posts/%s/comments' % plan.post(), dict(
+        headers=plan.auth(plan.user()), query={'item_per_page': 20})),
+    ('POST', '/posts/<string:post_id>/comments'): lambda plan: ('/posts/%s/comments' % plan.post(), dict(
+        headers=plan.auth(plan.user()), json={'body': plan.data.words(20)})),
+    ('GET', '/posts/<string:post_id>/comments/<string:comment_id>'): lambda plan: _comment(plan, 'GET'),
+    ('PUT', '/posts/<string:post_id>/comments/<string:comment_id>'): lambda plan: _comment(plan, 'PUT'),
+    ('DELETE', '/posts/<string:post_id>/comments/<string:comment_id>'): lambda plan: _comment(plan, 'DELETE'),
+    ('GET', '/export/<string:collection>'): lambda plan: ('/export/%s' % plan.rng.choice(['users', 'posts', 'follows']),
+                                                          dict(headers=plan.auth(plan.admin))),
+}
+
+
+def api_rules(app):
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.startswith('api.'):
+            for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+                yield rule.rule[len('/api'):], method
+
+
+def queries(headers):
+    match = SERVER_TIMING_QUERIES.search(headers.get('Server-Timing') or '')
+    return int(match.group(1)) if match else 0
+
+
+def run_client(app, requests):
+    client = app.test_client()
+    samples = []
+    for item in requests:
+        start = time.perf_counter()
+        try:
+            response = client.open(item['path'], method=item['method'], query_string=item.get('query'),
+                                   json=item.get('json'), headers=item.get('headers'))
+            response.get_data()
+        except Exception:
+            # the testing config propagates exceptions, a server would have answered 500
+            samples.append((item['route'], time.perf_counter() - start, 500, 0))
+            continue
+        samples.append((item['route'], time.perf_counter() - start, response.status_code, queries(response.headers)))
+    return samples
+
+
+def run_wsgi(app, requests, threads):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        return drive(requests, server.port, threads)
+    finally:
+        server.shutdown()
+
+
+def drive(requests, port, threads):
+    """Replay the requests over HTTP against a server on localhost, from several client threads."""
+    pending, lock, samples = iter(requests), Lock(), []
+
+    def worker():
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            path = item['path'] + ('?' + urlencode(item['query']) if item.get('query') else '')
+            headers = dict(item.get('headers') or {})
+            body = None
+            if 'json' in item:
+                body, headers['Content-Type'] = json.dumps(item['json']), 'application/json'
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            start = time.perf_counter()
+            connection.request(item['method'], path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            connection.close()
+            with lock:
+                samples.append((item['route'], elapsed, response.status, queries(response.headers)))
+
+    workers = [Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return samples
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+
+def summarize(samples, elapsed=None):
+    latencies = sorted(sample[1] for sample in samples)
+    summary = {'requests': len(samples),
+               'status': dict(Counter(str(sample[2]) for sample in samples)),
+               'p50_ms': percentile(latencies, 0.50), 'p95_ms': percentile(latencies, 0.95),
+               'p99_ms': percentile(latencies, 0.99),
+               'queries_per_request': sum(sample[3] for sample in samples) / float(len(samples))}
+    if elapsed is not None:
+        summary['throughput_rps'] = len(samples) / elapsed
+    return summary
+
+
+def report(samples, elapsed):
+    by_route = defaultdict(list)
+    for sample in samples:
+        by_route[sample[0]].append(sample)
+    return {'total': summarize(samples, elapsed),
+            'routes': {route: summarize(route_samples) for route, route_samples in sorted(by_route.items())}}
+
+
+def dataset_arguments(parser):
+    parser.add_argument('--requests', type=int, default=50, help='requests per route')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--comments', type=int, default=10, help='embedded comments per post')
+    parser.add_argument('--follows', type=int, default=20, help='followings drawn per user')
+    parser.add_argument('--skew', type=float, default=1.2, help='zipf exponent of follower popularity')
+    parser.add_argument('--body-size', type=int, default=600, help='approximate characters per post body')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--methods', nargs='+', default=['GET', 'POST', 'PUT', 'DELETE'], help='routes to drive')
+
+
+def dataset_settings(args):
+    names = ('users', 'posts', 'comments', 'follows', 'skew', 'body_size', 'seed')
+    return {name: getattr(args, name) for name in names}
+
+
+def seed_plan(app, args):
+    """Seed the dataset described by the arguments and build the shuffled request plan over it."""
+    with app.app_context():
+        dataset = Dataset(args.users, args.posts, args.comments, args.follows, args.skew, args.body_size,
+                          args.seed).seed()
+        rules = sorted(rule for rule in api_rules(app) if rule[1] in args.methods)
+        return Plan(dataset, random.Random(args.seed)).build(rules, args.requests)
+
+
+def write_report(result, output):
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as report_file:
+            report_file.write(text + '\n')
+    else:
+        print(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['client', 'wsgi'], default='client')
+    parser.add_argument('--threads', type=int, default=8, help='client threads in wsgi mode')
+    parser.add_argument('-o', '--output', help='write the report to this file instead of stdout')
+    dataset_arguments(parser)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    requests, skipped = seed_plan(app, args)
+    start = time.perf_counter()
+    samples = run_client(app, requests) if args.mode == 'client' else run_wsgi(app, requests, args.threads)
+    elapsed = time.perf_counter() - start
+
+    result = dict(report(samples, elapsed), mode=args.mode, threads=args.threads if args.mode == 'wsgi' else 1,
+                  dataset=dataset_settings(args), skipped=skipped)
+    write_report(result, args.output)
+
+
+if __name__ == '__main__':
+    main()
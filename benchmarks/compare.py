@@ -0,0 +1,48 @@
+"""Compare two reports of ``benchmarks.api`` route by route.
+
+    $ python -m benchmarks.compare base.json head.json --threshold 10
+
+Prints the relative change of every latency percentile and the absolute change of queries per request, and
+exits with status 1 when a percentile grew by more than ``--threshold`` percent or a route issues more queries.
+"""
+import argparse
+import json
+import sys
+
+PERCENTILES = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(base, head):
+    return round((head - base) * 100.0 / base, 1) if base else None
+
+
+def compare(base, head, threshold):
+    routes, regressions = {}, []
+    for route in sorted(set(base['routes']) & set(head['routes'])):
+        before, after = base['routes'][route], head['routes'][route]
+        delta = {name: change(before[name], after[name]) for name in PERCENTILES}
+        delta['queries_per_request'] = after['queries_per_request'] - before['queries_per_request']
+        routes[route] = delta
+        if delta['queries_per_request'] > 0 or any((delta[name] or 0) > threshold for name in PERCENTILES):
+            regressions.append(route)
+    throughput = change(base['total'].get('throughput_rps'), head['total'].get('throughput_rps'))
+    return {'throughput_rps_change': throughput, 'routes': routes, 'regressions': regressions,
+            'only_in_base': sorted(set(base['routes']) - set(head['routes'])),
+            'only_in_head': sorted(set(head['routes']) - set(base['routes']))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed latency growth, in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as base, open(args.head) as head:
+        result = compare(json.load(base), json.load(head), args.threshold)
+    print(json.dumps(result, indent=2, sort_keys=True))
+    sys.exit(1 if result['regressions'] else 0)
+
+
+if __name__ == '__main__':
+    main()
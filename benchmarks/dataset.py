@@ -0,0 +1,109 @@
+"""Parametrized synthetic dataset: users, posts with embedded comments and a follow graph with skewed degree.
+
+Documents are bulk inserted straight into the collections, so seeding must run inside an application context.
+"""
+import random
+from datetime import datetime, timedelta
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+from app import hasher
+from app.models import Follow, Permission, Post, Timeline, User
+
+PASSWORD = 'benchmark'
+
+
+def access_token(user_id):
+    """Access token of a seeded user with the permission claims the login endpoint puts in it."""
+    user = User.objects.get(id=user_id)
+    return create_access_token(identity=str(user_id), user_claims=user.token_claims())
+
+
+class Dataset:
+
+    def __init__(self, users, posts, comments, follows, skew, body_size, seed):
+        self.users = users
+        self.posts = posts
+        self.comments = comments
+        self.follows = follows
+        self.skew = skew
+        self.body_size = body_size
+        self.rng = random.Random(seed)
+        self.user_ids = []
+        self.post_ids = []
+        self.comment_ids = {}
+        self.edges = []
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def seed(self):
+        for model in (User, Post, Follow, Timeline):
+            model.drop_collection()
+            model.ensure_indexes()
+        self._seed_users()
+        self._seed_posts()
+        self._seed_follows()
+        return self
+
+    def _seed_users(self):
+        hashed_password = hasher.hash(PASSWORD)
+        joined = datetime.utcnow() - timedelta(days=365)
+        users = []
+        for index in range(self.users):
+            permissions = Permission.ADMIN | Permission.MODERATE if index == 0 else 0
+            users.append({
+                '_id': ObjectId(), 'username': 'user%d' % index, 'email': 'user%d@example.com' % index,
+                'first_name': 'First%d' % index, 'last_name': 'Last%d' % index, 'phone': '%010d' % index,
+                'hashed_password': hashed_password, 'member_since': joined + timedelta(minutes=index),
+                'deleted_at': None, 'version': 0, 'followers_count': 0, 'followings_count': 0,
+                'roles': [{'name': 'User', 'default': True,
+                           'permissions': Permission.FOLLOW | Permission.COMMENT | Permission.WRITE | permissions}],
+            })
+        User._get_collection().insert_many(users)
+        self.user_ids = [user['_id'] for user in users]
+
+    def _seed_posts(self):
+        start = datetime.utcnow() - timedelta(days=30)
+        collection = Post._get_collection()
+        for offset in range(0, self.posts, 500):
+            posts = []
+            for index in range(offset, min(offset + 500, self.posts)):
+                comments = [{'_id': ObjectId(), 'body': self.words(20), 'disabled': False,
+                             'timestamp': start + timedelta(minutes=index, seconds=position),
+                             'author': self.rng.choice(self.user_ids)} for position in range(self.comments)]
+                posts.append({
+                    '_id': ObjectId(), 'title': self.words(6), 'body': self.words(self.body_size // 6),
+                    'image_url': 'http://example.com/%d.png' % index, 'timestamp': start + timedelta(minutes=index),
+                    'deleted_at': None, 'version': 0, 'author': self.rng.choice(self.user_ids), 'comments': comments,
+                })
+                self.comment_ids.setdefault(posts[-1]['_id'], [comment['_id'] for comment in comments])
+            collection.insert_many(posts)
+            self.post_ids += [post['_id'] for post in posts]
+
+    def _seed_follows(self):
+        # Zipf-like popularity: a few accounts collect most of the followers.
+        weights = [1.0 / (rank + 1) ** self.skew for rank in range(len(self.user_ids))]
+        edges = set()
+        for follower in self.user_ids:
+            for followee in self.rng.choices(self.user_ids, weights, k=self.follows):
+                if followee != follower:
+                    edges.add((follower, followee))
+        self.edges = sorted(edges)
+        if self.edges:
+            Follow._get_collection().insert_many([{'follower': follower, 'followee': followee,
+                                                   'timestamp': datetime.utcnow()} for follower, followee in self.edges])
+        for field, counter in (('$followee', 'followers_count'), ('$follower', 'followings_count')):
+            for count in Follow._get_collection().aggregate([{'$group': {'_id': field, 'count': {'$sum': 1}}}]):
+                User._get_collection().update_one({'_id': count['_id']}, {'$set': {counter: count['count']}})
+
+        authors = {}
+        for post in Post.objects.only('id', 'timestamp', 'author'):
+            authors.setdefault(post.author.id, (post.author, []))[1].append(post)
+        for author, posts in authors.values():
+            Timeline.fan_out(author, posts)
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+         'magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+         'consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint '
+         'occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim id est laborum').split()
@@ -0,0 +1,73 @@
+"""JSON encoders and response compression on realistic post pages.
+
+Seeds posts with long bodies and embedded comments in MONGO_DB (a local mongod, or mongomock://localhost), then
+times each JSON provider on a page of GET /api/posts/, each compressor and level on the encoded page, and the
+whole request through the test client for every provider and Accept-Encoding:
+
+    $ MONGO_DB=mongodb://localhost:27017/blog_bench python -m benchmarks.encoding --item-per-page 20 --body-size 25000
+"""
+import argparse
+import json
+import time
+import zlib
+from app import create_app
+from app.compression import brotli
+from app.encoding import JSON_PROVIDERS, orjson
+from .dataset import Dataset, access_token
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)[len(samples) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--item-per-page', type=int, default=20)
+    parser.add_argument('--body-size', type=int, default=25000, help='approximate characters per post body')
+    parser.add_argument('--comments', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        dataset = Dataset(50, args.item_per_page, args.comments, 5, 1.0, args.body_size, 42).seed()
+        headers = {'Authorization': 'Bearer ' + access_token(dataset.user_ids[0])}
+    client = app.test_client()
+    url = '/api/posts/?item_per_page=%d' % args.item_per_page
+    page = json.loads(client.get(url, headers=headers).data)
+
+    providers = [name for name in JSON_PROVIDERS if name != 'orjson' or orjson is not None]
+    encoders = {}
+    for name in providers:
+        milliseconds, body = timed(lambda: JSON_PROVIDERS[name].dumps(page), args.repeat)
+        encoders[name] = {'ms_p50': milliseconds, 'bytes': len(body)}
+
+    compressors = {}
+    for level in (1, 6, 9):
+        milliseconds, compressed = timed(lambda: zlib.compress(body, level), args.repeat)
+        compressors['gzip-%d' % level] = {'ms_p50': milliseconds, 'bytes': len(compressed)}
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            milliseconds, compressed = timed(lambda: brotli.compress(body, quality=quality), args.repeat)
+            compressors['br-%d' % quality] = {'ms_p50': milliseconds, 'bytes': len(compressed)}
+
+    requests = {}
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    for name in providers:
+        app.json_provider = JSON_PROVIDERS[name]()
+        for encoding in encodings:
+            request_headers = dict(headers, **{'Accept-Encoding': encoding})
+            milliseconds, response = timed(lambda: client.get(url, headers=request_headers), args.repeat)
+            requests['%s+%s' % (name, encoding)] = {'ms_p50': milliseconds, 'bytes': len(response.data)}
+
+    print(json.dumps({'item_per_page': args.item_per_page, 'body_size': args.body_size, 'comments': args.comments,
+                      'encoders': encoders, 'compressors': compressors, 'requests': requests}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
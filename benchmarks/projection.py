@@ -0,0 +1,64 @@
+"""MongoDB reply bytes per page with and without the schema-derived projections of the list and detail views.
+
+Seeds MONGO_DB (a local mongod, or mongomock://localhost), then loads one page of each view's query in full and
+projected to the fields its response schema dumps, and reports the BSON bytes and time of both:
+
+    $ MONGO_DB=mongodb://localhost:27017/blog_bench python -m benchmarks.projection --comments 50 --body-size 5000
+"""
+import argparse
+import json
+from bson import BSON
+from app import create_app
+from app.models import Follow, Post, User
+from app.prefetch import schema_fields
+from app.schemas import followers_schema, post_schema, posts_schema, user_schema, users_schema
+from app.utils import VERSION_FIELDS
+from .dataset import Dataset
+from .encoding import timed
+
+# Query of each view, as it runs before projection, with the schema it dumps and the fields the view reads itself.
+VIEWS = {
+    'GET /posts/': (lambda dataset: Post.objects(deleted_at=None).order_by('-timestamp', '-id'), posts_schema, ()),
+    'GET /posts/<id>': (lambda dataset: Post.objects(id=dataset.post_ids[0], deleted_at=None), post_schema,
+                        VERSION_FIELDS),
+    'GET /users/': (lambda dataset: User.objects(deleted_at=None).order_by('-member_since', '-id'), users_schema, ()),
+    'GET /users/<id>': (lambda dataset: User.objects(id=dataset.user_ids[0], deleted_at=None), user_schema,
+                        VERSION_FIELDS),
+    'GET /users/<id>/followers': (lambda dataset: Follow.objects(followee=dataset.user_ids[0])
+                                  .order_by('-timestamp', '-id'), followers_schema, ()),
+}
+
+
+def page_bytes(queryset, item_per_page):
+    return sum(len(BSON.encode(document)) for document in queryset.limit(item_per_page).as_pymongo())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--item-per-page', type=int, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--comments', type=int, default=20, help='average embedded comments per post')
+    parser.add_argument('--body-size', type=int, default=2000, help='approximate characters per post body')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    views = {}
+    with app.app_context():
+        dataset = Dataset(args.users, args.posts, args.comments, 20, 1.2, args.body_size, 42).seed()
+        for name, (query, schema, extra) in VIEWS.items():
+            fields = schema_fields(schema, query(dataset)._document, *extra)
+            full_ms, full = timed(lambda: page_bytes(query(dataset), args.item_per_page), args.repeat)
+            projected_ms, projected = timed(lambda: page_bytes(query(dataset).only(*fields), args.item_per_page),
+                                            args.repeat)
+            views[name] = {'fields': fields, 'full_bytes': full, 'projected_bytes': projected,
+                           'saved': round(1 - projected / full, 3) if full else 0.0,
+                           'full_ms_p50': full_ms, 'projected_ms_p50': projected_ms}
+
+    print(json.dumps({'item_per_page': args.item_per_page, 'comments': args.comments, 'body_size': args.body_size,
+                      'views': views}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Latency of GET /api/posts/search on a synthetic corpus.
+
+Needs a real mongod (text indexes are not available in mongomock):
+
+    $ MONGO_DB=mongodb://localhost:27017/blog_bench python -m benchmarks.search --posts 100000 --comments 5
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from app import create_app
+from app.models import Post, User
+from .dataset import access_token
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(size)]
+
+
+def seed(posts, comments, words, rng):
+    author = User(username='search-author', email='search-author@example.com').save()
+    vocabulary = make_vocabulary(words, rng)
+    # Zipf-like word frequencies, so queries cover both very common and very rare terms.
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+
+    def text(count):
+        return ' '.join(rng.choices(vocabulary, weights, k=count))
+
+    start = datetime.utcnow() - timedelta(days=365)
+
+    collection = Post._get_collection()
+    for offset in range(0, posts, 1000):
+        collection.insert_many([{
+            'title': text(6), 'body': text(200), 'author': author.id, 'deleted_at': None,
+            'timestamp': start + timedelta(minutes=offset + index),
+            'comments': [{'body': text(30), 'author': author.id} for _ in range(comments)],
+        } for index in range(min(1000, posts - offset))])
+    Post.ensure_indexes()
+    return author, vocabulary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=5)
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = create_app('testing')
+    with app.app_context():
+        author, vocabulary = seed(args.posts, args.comments, args.words, rng)
+        headers = {'Authorization': 'Bearer ' + access_token(author.id)}
+
+    client = app.test_client()
+    results = {}
+    for band, terms in (('common', vocabulary[:50]), ('mid', vocabulary[1000:1050]), ('rare', vocabulary[-50:])):
+        samples = []
+        for _ in range(args.queries):
+            start = time.perf_counter()
+            response = client.get('/api/posts/search', query_string={'q': rng.choice(terms)}, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.get_json()
+        samples.sort()
+        results[band] = {'p50_ms': samples[len(samples) // 2], 'p95_ms': samples[int(len(samples) * 0.95)]}
+    print(json.dumps({'posts': args.posts, 'comments_per_post': args.comments, 'latency': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
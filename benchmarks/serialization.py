@@ -0,0 +1,44 @@
+"""Per-item cost of dumping a page of posts with schema.dump versus the precompiled dump path.
+
+    $ python -m benchmarks.serialization --items 50 --repeat 200
+"""
+import argparse
+import json
+import timeit
+from bson import ObjectId
+from app import create_app
+from app.models import Post, User
+from app.schemas import posts_schema
+from app.serializers import compile_dump
+
+
+def make_posts(count, body_size):
+    author = User(id=ObjectId(), username='author', email='author@example.com', first_name='First',
+                  last_name='Last', phone='0000')
+    return [Post(id=ObjectId(), title='Post %d' % index, body='x' * body_size, image_url='http://example.com/i.png',
+                 author=author) for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--body-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.test_request_context():
+        posts = make_posts(args.items, args.body_size)
+        compiled = compile_dump(posts_schema)
+        assert compiled(posts) == posts_schema.dump(posts)
+
+        results = {}
+        for name, func in (('schema.dump', posts_schema.dump), ('compiled', compiled)):
+            seconds = min(timeit.repeat(lambda: func(posts), number=args.repeat, repeat=3))
+            results[name] = {'us_per_item': seconds / (args.repeat * args.items) * 1e6}
+        results['speedup'] = results['schema.dump']['us_per_item'] / results['compiled']['us_per_item']
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
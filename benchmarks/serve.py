@@ -0,0 +1,45 @@
+"""Seed the dataset, write the request plan to a file and serve the API in one mode, for benchmarks.servers:
+
+    $ python -m benchmarks.serve gevent 8001 /tmp/plan.json --users 1000 --methods GET
+"""
+import os
+import sys
+
+if sys.argv[1:2] == ['gevent']:
+    # before anything imports socket or threading, like wsgi.py does
+    os.environ['GEVENT'] = '1'
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import json
+import logging
+from werkzeug.serving import make_server
+from app import create_app
+from .api import dataset_arguments, seed_plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['sync', 'threaded', 'gevent'])
+    parser.add_argument('port', type=int)
+    parser.add_argument('plan')
+    dataset_arguments(parser)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    requests, _ = seed_plan(app, args)
+    with open(args.plan + '.tmp', 'w') as plan:
+        json.dump(requests, plan)
+    os.rename(args.plan + '.tmp', args.plan)
+
+    if args.mode == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('127.0.0.1', args.port), app, log=None).serve_forever()
+    else:
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        make_server('127.0.0.1', args.port, app, threaded=args.mode == 'threaded').serve_forever()
+
+
+if __name__ == '__main__':
+    main()
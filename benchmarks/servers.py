@@ -0,0 +1,77 @@
+"""Throughput and latency of the same request plan served by a single-threaded, a threaded and a gevent server.
+
+Each mode runs in its own process (gevent has to patch before anything else is imported), reseeds the dataset
+and is driven over HTTP by the same number of client threads. Run it against a local mongod, so every server
+process sees the dataset it seeded:
+
+    $ MONGO_DB=mongodb://localhost:27017/blog_bench python -m benchmarks.servers --threads 64 --methods GET
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from .api import dataset_arguments, dataset_settings, drive, report, write_report
+import json
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_until_ready(server, plan, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('The server exited with status {}.'.format(server.returncode))
+        if os.path.exists(plan):
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                pass
+        time.sleep(0.1)
+    raise RuntimeError('The server was not ready within {} seconds.'.format(timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=['sync', 'threaded', 'gevent'],
+                        default=['sync', 'threaded', 'gevent'])
+    parser.add_argument('--threads', type=int, default=64, help='concurrent client threads')
+    parser.add_argument('--timeout', type=int, default=600, help='seconds allowed for seeding')
+    parser.add_argument('-o', '--output', help='write the report to this file instead of stdout')
+    dataset_arguments(parser)
+    args = parser.parse_args()
+
+    settings = dict(dataset_settings(args), requests=args.requests)
+    argv = [value for name, setting in settings.items() for value in ('--' + name.replace('_', '-'), str(setting))]
+    argv += ['--methods'] + args.methods
+
+    results = {}
+    for mode in args.modes:
+        port = free_port()
+        with tempfile.TemporaryDirectory() as directory:
+            plan = os.path.join(directory, 'plan.json')
+            server = subprocess.Popen([sys.executable, '-m', 'benchmarks.serve', mode, str(port), plan] + argv)
+            try:
+                wait_until_ready(server, plan, port, args.timeout)
+                with open(plan) as plan_file:
+                    requests = json.load(plan_file)
+                start = time.perf_counter()
+                samples = drive(requests, port, args.threads)
+                results[mode] = report(samples, time.perf_counter() - start)['total']
+            finally:
+                server.terminate()
+                server.wait()
+
+    write_report({'threads': args.threads, 'methods': args.methods, 'dataset': settings, 'modes': results},
+                 args.output)
+
+
+if __name__ == '__main__':
+    main()
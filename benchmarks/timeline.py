@@ -0,0 +1,64 @@
+"""Fan-out-on-write versus fan-out-on-read latency of the home timeline at different follower counts.
+
+Runs against the database in MONGO_DB (a local mongod, or mongomock://localhost for a dry run):
+
+    $ MONGO_DB=mongodb://localhost:27017/blog_bench python -m benchmarks.timeline --followers 10 100 1000 10000
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from bson import ObjectId
+from app import create_app
+from app.models import Follow, Post, Timeline, User
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def seed(followers):
+    author = User(username='author-%s' % ObjectId(), email='%s@example.com' % ObjectId(), followers_count=followers)
+    author.save()
+    follower_ids = [ObjectId() for _ in range(followers)]
+    Follow._get_collection().insert_many([{'follower': follower_id, 'followee': author.id, 'timestamp': datetime.utcnow()}
+                                          for follower_id in follower_ids])
+    return author, follower_ids[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--followers', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    results = []
+    with app.app_context():
+        for followers in args.followers:
+            author, reader = seed(followers)
+            posts = [Post(title='Post', body='body', author=author).save() for _ in range(args.repeat)]
+
+            app.config['TIMELINE_FANOUT_LIMIT'] = followers
+            remaining = iter(posts)
+            write_on_write = timed(lambda: Timeline.fan_out(author, [next(remaining)]), args.repeat)
+            read_on_write = timed(lambda: Timeline.read(reader, limit=11), args.repeat)
+
+            app.config['TIMELINE_FANOUT_LIMIT'] = followers - 1
+            remaining = iter(posts)
+            write_on_read = timed(lambda: Timeline.fan_out(author, [next(remaining)]), args.repeat)
+            read_on_read = timed(lambda: Timeline.pull(Timeline.pulled_followees(reader), limit=11), args.repeat)
+
+            results.append({'followers': followers,
+                            'fan_out_on_write': {'write_ms_p50': write_on_write, 'read_ms_p50': read_on_write},
+                            'fan_out_on_read': {'write_ms_p50': write_on_read, 'read_ms_p50': read_on_read}})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
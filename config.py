@@ -1,9 +1,63 @@
 import os
 
+GEVENT = os.getenv('GEVENT') == '1'  # Serving with gevent workers; wsgi.py and manage.py monkey patch first.
+
+
+def mongodb_settings(default_host):
+    """Connection settings for flask-mongoengine; the pool and timeout options are passed on to MongoClient."""
+    return {
+        'host': os.getenv('MONGO_DB', default_host),
+        # a gevent worker runs thousands of greenlets over one pool, so it gets more connections and a longer wait
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 500 if GEVENT else 100)),  # Per server, per process.
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),  # Connections kept open while idle.
+        'waitQueueTimeoutMS': int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000 if GEVENT else 1000)),  # For a socket.
+        'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),  # Wait for a server.
+    }
+
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', '<replace with a secret key>')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', '<replace with a secret key>')
+    MAX_ITEM_PER_PAGE = 100  # Hard upper bound on item_per_page for every list endpoint.
+    BULK_MAX_ITEMS = 100  # Ceiling on the ids of a multi-get and the posts of a bulk write.
+    EXPORT_BATCH_SIZE = 1000  # Documents per cursor batch while streaming an export.
+    ARCHIVE_BATCH_SIZE = 500  # Soft-deleted rows moved to the archive per bulk write.
+    ARCHIVE_RATE = 1000  # Rows archived per second at most, to leave room for production traffic.
+    METRICS_ENABLED = True  # Per-endpoint metrics, scraped from /metrics.
+    METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING') == '1'  # Send app and MongoDB time to every client.
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer token that scrapes /metrics; without one it is not mounted.
+    METRICS_MONGO_BYTES = os.getenv('METRICS_MONGO_BYTES') == '1'  # Measure reply sizes by re-encoding every reply.
+    PRECOMPILED_SERIALIZERS = True  # Dump the hot list endpoints with generated code instead of schema.dump.
+    SCHEMA_PROJECTIONS = True  # Load only the fields the response schema dumps, on list and detail endpoints.
+    CURRENT_USER_CACHE_SIZE = int(os.getenv('CURRENT_USER_CACHE_SIZE', 0))  # Users cached per process, 0 disables.
+    CURRENT_USER_CACHE_TTL = int(os.getenv('CURRENT_USER_CACHE_TTL', 30))  # Seconds before a cached user is reloaded.
+    TIMELINE_LENGTH = 800  # Entries kept on each home timeline.
+    TIMELINE_FANOUT_LIMIT = 10000  # Authors with more followers are pulled on read; keep above 1000 (indexed).
+    TIMELINE_FANOUT_BATCH = 1000  # Timelines updated per bulk write while fanning out.
+    PROFILER_DIR = os.getenv('PROFILER_DIR')  # Directory where profiler data files are saved.
+    PROFILER_NUM_FUNCTION_RESTRICTIONS = 25  # Number of functions to include in the profiler report.
+    PROFILER_SAMPLE_RATE = int(os.getenv('PROFILER_SAMPLE_RATE', 0))  # Profile 1 request in N, 0 disables sampling.
+    PROFILER_TOKEN = os.getenv('PROFILER_TOKEN')  # Requests sending it in X-Profile are always profiled.
+    PROFILER_INTERVAL = 0.005  # Seconds between stack samples of a profiled request.
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')  # 'orjson', 'stdlib', or 'auto' for orjson when installed.
+    COMPRESS_ENABLED = True  # Negotiate brotli/gzip compression of API responses through Accept-Encoding.
+    COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain')  # Compressible responses.
+    COMPRESS_MIN_SIZE = 1024  # Bytes under which a response is not worth compressing.
+    COMPRESS_STREAM_SIZE = 1024 * 1024  # Bodies at least this large are compressed chunk by chunk while sent.
+    COMPRESS_GZIP_LEVEL = 6  # zlib level, 1 (fastest) to 9 (smallest).
+    COMPRESS_BROTLI_QUALITY = 4  # Brotli quality, 0 to 11; above 5 costs far more CPU than it saves bytes.
+    ACTIVITY_TRACKING = True  # Record last_seen of authenticated users, written behind in bulk.
+    ACTIVITY_FLUSH_SECONDS = 5  # Seconds between last_seen bulk writes.
+    ACTIVITY_FLUSH_SIZE = 1000  # Users buffered before a bulk write is started early.
+    CLAIMS_REFRESH_SECONDS = 30  # Role changes and deletions revoke older tokens within this many seconds.
+    MONGO_MAX_TIME_MS = int(os.getenv('MONGO_MAX_TIME_MS', 0))  # Server-side time limit of each query, 0 disables.
+    MONGO_SECONDARY_READS = os.getenv('MONGO_SECONDARY_READS', '0') == '1'  # Opted-in GET handlers read secondaries.
+    MONGO_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_MAX_STALENESS_SECONDS', 90))  # At least 90, per the driver.
+    MONGO_RECENT_WRITERS_SIZE = 10000  # Users remembered per process as having just written, to read the primary.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000')  # Rehashed on login when changed.
+    # Hashing processes (native threads under gevent), 0 hashes inline.
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 4 if GEVENT else 0))
+    PASSWORD_HASH_MAX_IN_FLIGHT = int(os.getenv('PASSWORD_HASH_MAX_IN_FLIGHT', 16))  # Beyond this, reject with 503.
 
     @classmethod
     def init_app(cls, app):
@@ -13,24 +67,14 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     DEBUG_TB_INTERCEPT_REDIRECTS = False
-    MONGODB_SETTINGS = {
-        'host': os.getenv('MONGO_DB', 'mongodb://localhost:27017/blog_dev')
-    }
-    PROFILER_DIR = None  # Directory where profiler data files are saved.
-    PROFILER_NUM_FUNCTION_RESTRICTIONS = 25  # Number of functions to include in the profiler report.
-
-    @classmethod
-    def init_app(cls, app):
-        from werkzeug.contrib.profiler import ProfilerMiddleware
-        app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[cls.PROFILER_NUM_FUNCTION_RESTRICTIONS],
-                                          profile_dir=cls.PROFILER_DIR)
+    MONGODB_SETTINGS = mongodb_settings('mongodb://localhost:27017/blog_dev')
+    PROFILER_SAMPLE_RATE = int(os.getenv('PROFILER_SAMPLE_RATE', 1))  # Profile every request.
 
 
 class ProductionConfig(Config):
-    MONGODB_SETTINGS = {
-        'host': os.getenv('MONGO_DB', 'mongodb://localhost:27017/blog_dev')
-    }
+    MONGODB_SETTINGS = mongodb_settings('mongodb://localhost:27017/blog_dev')
     LOGGING_FILENAME = 'log/prod.log'
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
 
     @classmethod
     def init_app(cls, app):
@@ -46,9 +90,8 @@ class ProductionConfig(Config):
 
 class TestingConfig(Config):
     TESTING = True
-    MONGODB_SETTINGS = {
-        'host': os.getenv('MONGO_DB', 'mongodb://localhost:27017/api_blog_test')
-    }
+    METRICS_SERVER_TIMING = True  # The benchmarks read queries per request from it.
+    MONGODB_SETTINGS = mongodb_settings('mongodb://localhost:27017/api_blog_test')
 
 
 config = {
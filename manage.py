@@ -1,4 +1,11 @@
 import os
+
+if os.getenv('GEVENT') == '1':
+    # patch before flask, pymongo or the app import socket, ssl and threading
+    from gevent import monkey
+    monkey.patch_all()
+
+import click
 from dotenv import load_dotenv
 
 
@@ -8,5 +15,191 @@ if os.path.exists(dotenv_path):
 
 
 from app import create_app
+from app.models import User, Post, Follow, CASE_INSENSITIVE
+from bson import ObjectId
+from pymongo import UpdateOne
+from mongoengine.queryset.visitor import Q
+from datetime import datetime
+from app.export import EXPORTS, export_lines, gzip_stream
+from app.archive import ARCHIVES, archive_deleted
+
+app = create_app(os.getenv('FLASK_CONFIG', 'default'))
+
+
+def bulk_write(collection, operations, batch_size):
+    """Run ``operations`` as unordered bulk writes of at most ``batch_size`` operations each."""
+    batch = []
+    for operation in operations:
+        batch.append(operation)
+        if len(batch) >= batch_size:
+            collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+
+
+def follow_created_at(follow):
+    # legacy entries without a timestamp still carry the ObjectId they were created with
+    if follow.get('timestamp') is not None:
+        return follow['timestamp']
+    object_id = follow['_id'] if isinstance(follow.get('_id'), ObjectId) else ObjectId()
+    return object_id.generation_time.replace(tzinfo=None)
+
+
+def legacy_follows(user):
+    """(follower, followee, timestamp) of the edges older releases embedded in a user document."""
+    for follow in user.get('followers') or []:
+        yield follow['follower'], user['_id'], follow_created_at(follow)
+    for follow in user.get('followings') or []:
+        yield user['_id'], follow['follower'], follow_created_at(follow)
+
+
+def recount_follows(users, follows):
+    """Set followers_count and followings_count from the Follow collection, with one bulk write of the users
+    whose counts are off. Counts are never reset first, so readers do not see zeros while this runs."""
+    counts = {}
+    for index, field in enumerate(('$followee', '$follower')):
+        for count in follows.aggregate([{'$group': {'_id': field, 'count': {'$sum': 1}}}], allowDiskUse=True):
+            counts.setdefault(count['_id'], [0, 0])[index] = count['count']
+
+    operations = []
+    for user in users.find({}, {'followers_count': 1, 'followings_count': 1}):
+        followers, followings = counts.get(user['_id'], (0, 0))
+        if (user.get('followers_count'), user.get('followings_count')) != (followers, followings):
+            operations.append(UpdateOne({'_id': user['_id']}, {'$set': {'followers_count': followers,
+                                                                        'followings_count': followings}}))
+    if operations:
+        users.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+@app.cli.command('migrate-follows')
+@click.option('--batch-size', default=1000, help='Number of edges upserted per bulk write.')
+def migrate_follows(batch_size):
+    """Move embedded User.followers/followings arrays into the Follow collection."""
+    users = User._get_collection()
+    follows = Follow._get_collection()
+
+    legacy = {'$or': [{'followers': {'$exists': True}}, {'followings': {'$exists': True}}]}
+    migrated = users.count_documents(legacy)
+    bulk_write(follows, (UpdateOne({'follower': follower, 'followee': followee},
+                                   {'$setOnInsert': {'timestamp': timestamp}}, upsert=True)
+                         for user in users.find(legacy, {'followers': 1, 'followings': 1})
+                         for follower, followee, timestamp in legacy_follows(user)), batch_size)
+    # edges written by earlier runs with a null timestamp fall back to their own _id time
+    bulk_write(follows, (UpdateOne({'_id': edge['_id']}, {'$set': {'timestamp': follow_created_at(edge)}})
+                         for edge in follows.find({'timestamp': None}, {'_id': 1})), batch_size)
+    recounted = recount_follows(users, follows)
+    users.update_many(legacy, {'$unset': {'followers': '', 'followings': ''}})
+
+    click.echo('Migrated the follow graph of {} users, corrected the counts of {}.'.format(migrated, recounted))
+
+
+@app.cli.command('scrub-passwords')
+def scrub_passwords():
+    """Remove the plaintext password field that older releases stored next to hashed_password."""
+    result = User._get_collection().update_many({'password': {'$exists': True}}, {'$unset': {'password': ''}})
+    click.echo('Removed the plaintext password of {} users.'.format(result.modified_count))
+
+
+@app.cli.command('migrate-deleted-at')
+def migrate_deleted_at():
+    """Rename the delete_at field that older releases stamped on deletion to deleted_at."""
+    for name, model in sorted(ARCHIVES.items()):
+        result = model._get_collection().update_many({'delete_at': {'$exists': True}},
+                                                     {'$rename': {'delete_at': 'deleted_at'}})
+        click.echo('{}: renamed delete_at on {} rows.'.format(name, result.modified_count))
+
+
+MODELS = (User, Post, Follow)
+
+# Query shapes issued by the API, keyed by a short description. Placeholder ids are enough for explain().
+QUERY_SHAPES = {
+    'posts list (page)': lambda: Post.objects(deleted_at=None).skip(0).limit(11),
+    'posts list (cursor)': lambda: Post.objects(deleted_at=None).order_by('-timestamp', '-id').limit(11),
+    'post by id': lambda: Post.objects(id=ObjectId(), deleted_at=None),
+    'comments window': lambda: Post.objects(id=ObjectId()).only('comments'),
+    'comment by id': lambda: Post.objects(comments__id=ObjectId()),
+    'users list (page)': lambda: User.objects(deleted_at=None).skip(0).limit(11),
+    'users list (cursor)': lambda: User.objects(deleted_at=None).order_by('-member_since', '-id').limit(11),
+    'user by id': lambda: User.objects(id=ObjectId(), deleted_at=None),
+    'current user': lambda: User.objects(id=ObjectId(), deleted_at=None),
+    'login by username': lambda: User.objects(username='username', deleted_at=None).collation(CASE_INSENSITIVE),
+    'archivable posts': lambda: Post.objects(deleted_at__type='date', deleted_at__lt=datetime.utcnow()),
+    'archivable users': lambda: User.objects(deleted_at__type='date', deleted_at__lt=datetime.utcnow()),
+    'role version changes': lambda: User.objects(role_version__gt=0, updated_at__gte=datetime.utcnow()),
+    'unique fields check': lambda: User.objects(Q(email='email') | Q(username='username')).collation(CASE_INSENSITIVE),
+    'author batch': lambda: User.objects(id__in=[ObjectId(), ObjectId()]),
+    'followers list': lambda: Follow.objects(followee=ObjectId()).order_by('-timestamp', '-id').limit(11),
+    'followings list': lambda: Follow.objects(follower=ObjectId()).order_by('-timestamp', '-id').limit(11),
+    'follow edge': lambda: Follow.objects(follower=ObjectId(), followee=ObjectId()),
+}
+
+
+def plan_stages(plan):
+    yield plan.get('stage')
+    for child in plan.get('inputStages', []) + [plan[key] for key in ('inputStage', 'queryPlan') if key in plan]:
+        yield from plan_stages(child)
+
+
+@app.cli.group()
+def indexes():
+    """Manage the indexes declared in model meta."""
+
+
+@indexes.command('create')
+def create_indexes():
+    """Create the declared indexes in the background."""
+    for model in MODELS:
+        model.ensure_indexes()
+        click.echo('{}: {}'.format(model._get_collection_name(), ', '.join(model._get_collection().index_information())))
+
+
+@indexes.command('drop')
+@click.confirmation_option(prompt='Drop every secondary index?')
+def drop_indexes():
+    """Drop every index except _id."""
+    for model in MODELS:
+        model._get_collection().drop_indexes()
+        click.echo('{}: dropped'.format(model._get_collection_name()))
+
+
+@indexes.command('explain')
+def explain_indexes():
+    """Print the winning plan of every API query shape and flag collection scans."""
+    collscans = 0
+    for name, queryset in QUERY_SHAPES.items():
+        plan = queryset().explain()['queryPlanner']['winningPlan']
+        stages = [stage for stage in plan_stages(plan) if stage]
+        collscan = 'COLLSCAN' in stages
+        collscans += collscan
+        click.echo('{:<4} {:<24} {}'.format('!!' if collscan else 'ok', name, ' <- '.join(stages)))
+    click.echo('{} of {} query shapes use COLLSCAN.'.format(collscans, len(QUERY_SHAPES)))
+
+
+@app.cli.command('export')
+@click.argument('collection', type=click.Choice(sorted(EXPORTS)))
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='File to write, stdout by default.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the NDJSON stream.')
+@click.option('--after', help='Resume after this _id checkpoint.')
+@click.option('--fields', help='Comma separated fields to export.')
+@click.option('--batch-size', default=None, type=int, help='Documents per cursor batch.')
+def export(collection, output, compress, after, fields, batch_size):
+    """Stream a collection as NDJSON, in _id order."""
+    lines = export_lines(collection, after=after, fields=fields.split(',') if fields else None,
+                         batch_size=batch_size or app.config['EXPORT_BATCH_SIZE'])
+    for chunk in gzip_stream(lines) if compress else (line.encode() for line in lines):
+        output.write(chunk)
+
 
-app = create_app(os.getenv('FLASK_CONFIG', 'default'))
\ No newline at end of file
+@app.cli.command('archive')
+@click.argument('collections', nargs=-1, type=click.Choice(sorted(ARCHIVES)))
+@click.option('--days', default=30, help='Archive rows deleted more than this many days ago.')
+@click.option('--batch-size', default=None, type=int, help='Rows moved per bulk write.')
+@click.option('--rate', default=None, type=float, help='Rows moved per second at most, 0 for no limit.')
+def archive(collections, days, batch_size, rate):
+    """Move soft-deleted rows into <collection>_archive collections, all collections by default."""
+    for name in collections or sorted(ARCHIVES):
+        moved = sum(archive_deleted(name, days, batch_size=batch_size or app.config['ARCHIVE_BATCH_SIZE'],
+                                    rate=app.config['ARCHIVE_RATE'] if rate is None else rate))
+        click.echo('{}: archived {} rows.'.format(name, moved))
@@ -0,0 +1,41 @@
+import os
+
+# mongomock unless CI points the suite at a real server; read by config.py when the app is imported
+os.environ.setdefault('MONGO_DB', 'mongomock://localhost/api_blog_test')
+
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from app.models import Follow, Permission, Post, Role, Timeline, User
+
+
+@pytest.fixture(scope='session')
+def app():
+    return create_app('testing')
+
+
+@pytest.fixture
+def client(app):
+    with app.app_context():
+        for model in (Follow, Post, Timeline, User):
+            model.drop_collection()
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(username, admin=False):
+        roles = [Role(name='Administrator', permissions=Permission.ADMIN)] if admin else []
+        with app.app_context():
+            return User(username=username, email=username + '@example.com', first_name='First', last_name='Last',
+                        phone='0000000000', roles=roles).save()
+    return make_user
+
+
+@pytest.fixture
+def auth(app):
+    def auth(user):
+        with app.app_context():
+            return {'Authorization': 'Bearer ' + create_access_token(identity=str(user.id))}
+    return auth
@@ -0,0 +1,19 @@
+from datetime import datetime
+from app.models import Comment, Post
+
+
+def test_deleted_posts_take_no_comments(client, make_user, auth):
+    author = make_user('author')
+    post = Post(title='title', body='body', image_url='http://example.com/image.png', author=author,
+                comments=[Comment(body='comment', author=author)]).save()
+    comment_id = post.comments[0].id
+    url = '/api/posts/%s/comments' % post.id
+    assert client.post(url, json={'body': 'live'}, headers=auth(author)).status_code == 201
+
+    post.update(set__deleted_at=datetime.utcnow())
+
+    assert client.get(url, headers=auth(author)).status_code == 404
+    assert client.get('%s/%s' % (url, comment_id), headers=auth(author)).status_code == 404
+    assert client.post(url, json={'body': 'late'}, headers=auth(author)).status_code == 404
+    assert client.delete('%s/%s' % (url, comment_id), headers=auth(author)).status_code == 404
+    assert len(Post.objects.get(id=post.id).comments) == 2
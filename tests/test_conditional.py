@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from app.api import comments
+from app.models import Comment, Post, User
+
+
+def make_post(author):
+    return Post(title='title', body='body', image_url='http://example.com/image.png', author=author).save()
+
+
+def test_post_etag_follows_author_last_seen(client, make_user, auth):
+    author = make_user('author')
+    post = make_post(author)
+
+    response = client.get('/api/posts/%s' % post.id, headers=auth(author))
+    assert 'last_seen' in response.get_json()['data']['author']
+    etag = response.headers['ETag']
+    assert client.get('/api/posts/%s' % post.id, headers={**auth(author), 'If-None-Match': etag}).status_code == 304
+
+    User.objects(id=author.id).update_one(set__last_seen=datetime.utcnow() + timedelta(minutes=1))
+    response = client.get('/api/posts/%s' % post.id, headers={**auth(author), 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_comment_validators_are_answered_before_loading_comments(client, make_user, auth, monkeypatch):
+    author = make_user('author')
+    post = make_post(author)
+    post.update(push__comments=Comment(body='comment', author=author))
+    comment_id = Post.objects.get(id=post.id).comments[0].id
+    urls = ['/api/posts/%s/comments' % post.id, '/api/posts/%s/comments/%s' % (post.id, comment_id)]
+    etags = [client.get(url, headers=auth(author)).headers['ETag'] for url in urls]
+
+    loads = []
+    monkeypatch.setattr(comments, 'prefetch_references', lambda *args: loads.append(args))
+    for url, etag in zip(urls, etags):
+        assert client.get(url, headers={**auth(author), 'If-None-Match': etag}).status_code == 304
+    assert not loads
+
+    User.objects(id=author.id).update_one(inc__version=1)
+    monkeypatch.undo()
+    for url, etag in zip(urls, etags):
+        assert client.get(url, headers={**auth(author), 'If-None-Match': etag}).status_code == 200
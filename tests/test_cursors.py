@@ -0,0 +1,12 @@
+import base64
+import pytest
+
+
+@pytest.mark.parametrize('cursor', ['not base64', '1:2:3', '99999999999999999999:5d6e4f3a2b1c0d9e8f7a6b5c'])
+def test_invalid_cursor_is_a_bad_request(client, make_user, auth, cursor):
+    user = make_user('user')
+    cursor = base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    response = client.get('/api/posts/', query_string={'cursor': cursor}, headers=auth(user))
+
+    assert response.status_code == 400
@@ -0,0 +1,10 @@
+from app import metrics
+
+
+def test_server_timing_is_opt_in(client, make_user, auth, monkeypatch):
+    user = make_user('user')
+    monkeypatch.setattr(metrics, 'server_timing', False)
+    assert 'Server-Timing' not in client.get('/api/posts/', headers=auth(user)).headers
+
+    monkeypatch.setattr(metrics, 'server_timing', True)
+    assert 'queries' in client.get('/api/posts/', headers=auth(user)).headers['Server-Timing']
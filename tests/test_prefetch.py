@@ -0,0 +1,42 @@
+from app.models import Comment, Follow, Post
+from app.prefetch import get_dereference_count
+
+
+def test_posts_page_loads_authors_in_one_query(client, make_user, auth):
+    authors = [make_user('author%d' % index) for index in range(3)]
+    for index in range(9):
+        Post(title='title', body='body', image_url='http://example.com/image.png', author=authors[index % 3]).save()
+
+    response = client.get('/api/posts/', query_string={'item_per_page': 9}, headers=auth(authors[0]))
+
+    assert response.status_code == 200
+    assert [post['author']['username'] for post in response.json['data']].count('author1') == 3
+    # one batched load for the author field, not one per post
+    assert get_dereference_count() == 1
+
+
+def test_comments_page_loads_authors_in_one_query(client, make_user, auth):
+    authors = [make_user('author%d' % index) for index in range(3)]
+    post = Post(title='title', body='body', image_url='http://example.com/image.png', author=authors[0],
+                comments=[Comment(body='comment', author=authors[index % 3]) for index in range(9)]).save()
+
+    response = client.get('/api/posts/%s/comments' % post.id, query_string={'item_per_page': 9},
+                          headers=auth(authors[0]))
+
+    assert response.status_code == 200
+    assert len(response.json['data']) == 9
+    assert get_dereference_count() == 1
+
+
+def test_followers_page_loads_followers_in_one_query(client, make_user, auth):
+    user = make_user('followee')
+    for index in range(9):
+        Follow(follower=make_user('follower%d' % index), followee=user).save()
+
+    response = client.get('/api/users/%s/followers' % user.id, query_string={'item_per_page': 9}, headers=auth(user))
+
+    assert response.status_code == 200
+    assert sorted(follow['follower']['username'] for follow in response.json['data']) == \
+        ['follower%d' % index for index in range(9)]
+    # the followee is excluded from the schema, so follower is the only reference loaded
+    assert get_dereference_count() == 1
@@ -0,0 +1,74 @@
+from app import ma
+from app.models import Comment, Post, User
+from app.prefetch import schema_fields, schema_projection
+from app.reads import QuerySet
+from app.schemas import CommentSchema, PostSchema, posts_schema, users_schema
+from app.utils import USER_VERSION_FIELDS, VERSION_FIELDS
+
+
+class PostWithCommentsSchema(PostSchema):
+    comments = ma.Nested(CommentSchema, many=True)
+
+
+def test_post_list_projection_excludes_comments():
+    assert set(schema_fields(posts_schema, Post)) == {'id', 'title', 'body', 'image_url', 'timestamp', 'author'}
+
+
+def test_user_projection_is_the_dumped_fields():
+    assert set(schema_fields(users_schema, User)) == {'id', 'username', 'email', 'first_name', 'last_name', 'phone',
+                                                      'member_since', 'last_seen'}
+
+
+def test_nested_embedded_fields_are_dotted_paths():
+    fields = schema_fields(PostWithCommentsSchema(), Post)
+
+    assert 'comments' not in fields
+    assert {'comments.id', 'comments.body', 'comments.author', 'comments.timestamp'} <= set(fields)
+    assert set(schema_fields(CommentSchema(), Comment)) == {'id', 'body', 'disabled', 'timestamp', 'author'}
+
+
+def test_raw_projection_uses_database_field_names():
+    projection = schema_projection(PostWithCommentsSchema(), Post, *VERSION_FIELDS)
+
+    assert projection['_id'] == projection['comments._id'] == projection['version'] == 1
+    assert 'id' not in projection and 'comments' not in projection
+
+
+def record_projections(monkeypatch):
+    projections = []
+    project = QuerySet.project
+
+    def recording(self, schema, *extra):
+        queryset = project(self, schema, *extra)
+        projections.append((self._document, set(queryset._loaded_fields.as_dict())))
+        return queryset
+
+    monkeypatch.setattr(QuerySet, 'project', recording)
+    return projections
+
+
+def test_post_detail_loads_version_fields(client, make_user, auth, monkeypatch):
+    author = make_user('author')
+    post = Post(title='title', body='body', image_url='http://example.com/image.png', author=author, version=3).save()
+    projections = record_projections(monkeypatch)
+
+    response = client.get('/api/posts/%s' % post.id, headers=auth(author))
+
+    assert response.status_code == 200
+    assert projections == [(Post, {'_id', 'title', 'body', 'image_url', 'timestamp', 'author', *VERSION_FIELDS})]
+    # a field left out of the projection would read as its default, version 0
+    assert response.headers['ETag'].startswith('"{}.3.'.format(post.id))
+
+
+def test_user_detail_loads_version_fields(client, make_user, auth, monkeypatch):
+    admin = make_user('admin', admin=True)
+    user = make_user('user')
+    User.objects(id=user.id).update_one(set__version=2)
+    projections = record_projections(monkeypatch)
+
+    response = client.get('/api/users/%s' % user.id, headers=auth(admin))
+
+    assert response.status_code == 200
+    assert projections[0][0] is User and set(USER_VERSION_FIELDS) <= projections[0][1]
+    assert 'hashed_password' not in projections[0][1] and 'roles' not in projections[0][1]
+    assert response.headers['ETag'].startswith('"{}.2.'.format(user.id))
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from app.models import Follow, Post, Timeline, User
+
+
+def read_timeline(user_id, before=None, limit=10):
+    # Timeline.read in Python: mongomock does not support $or inside the $filter expression
+    timeline = Timeline.objects(id=user_id).first()
+    entries = [(entry.timestamp, entry.post.id) for entry in (timeline.entries if timeline else [])]
+    return [entry for entry in entries if before is None or entry < before][:limit]
+
+
+def test_timeline_merges_pulled_posts_and_skips_deleted_ones(app, client, make_user, auth, monkeypatch):
+    reader, author, celebrity = make_user('reader'), make_user('author'), make_user('celebrity')
+    Follow.follow(reader.id, author.id)
+    Follow.follow(reader.id, celebrity.id)
+    monkeypatch.setitem(app.config, 'TIMELINE_FANOUT_LIMIT', 0)
+    User.objects(id=author.id).update_one(set__followers_count=0)
+
+    start = datetime(2020, 1, 1)
+    posts = []
+    with app.app_context():
+        for minute in range(8):
+            post = Post(title=str(minute), body='body', image_url='http://example.com/image.png',
+                        author=celebrity if minute % 4 == 3 else author, timestamp=start + timedelta(minutes=minute))
+            post.save()
+            if post.author.id == author.id:
+                Timeline.fan_out(User.objects.get(id=author.id), [post])
+            posts.append(post)
+    # fanned-out entries of deleted posts stay in the timeline
+    Post.objects(id__in=[posts[6].id, posts[5].id, posts[4].id]).update(set__deleted_at=datetime.utcnow())
+
+    monkeypatch.setattr(Timeline, 'read', staticmethod(read_timeline))
+    followees = []
+    pulled_followees = Timeline.pulled_followees
+    monkeypatch.setattr(Timeline, 'pulled_followees', staticmethod(
+        lambda user_id: followees.append(user_id) or pulled_followees(user_id)))
+
+    titles, cursor = [], None
+    while True:
+        url = '/api/users/%s/timeline?item_per_page=2' % reader.id + ('&cursor=' + cursor if cursor else '')
+        response = client.get(url, headers=auth(reader))
+        assert response.status_code == 200
+        body = response.get_json()
+        titles.append([post['title'] for post in body['data']])
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+
+    assert titles == [['7', '3'], ['2', '1'], ['0']]
+    # the pulled accounts are resolved once per page, not once per refill
+    assert len(followees) == len(titles)
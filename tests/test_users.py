@@ -0,0 +1,39 @@
+from flask_jwt_extended import create_refresh_token
+from app.models import Role, User
+
+
+def signup(client, username, email):
+    return client.post('/api/users/', json={'username': username, 'email': email, 'first_name': 'First',
+                                            'last_name': 'Last', 'phone': '0000000000', 'password': 'secret'})
+
+
+def test_signup_reports_taken_username_and_email(client):
+    assert signup(client, 'alice', 'alice@example.com').status_code == 201
+
+    response = signup(client, 'alice', 'alice@example.com')
+
+    assert response.status_code == 400
+    assert User.objects.count() == 1
+
+
+def test_login_with_the_signup_password(client):
+    assert signup(client, 'alice', 'alice@example.com').status_code == 201
+
+    assert 'access_token' in client.post('/api/login', json={'username': 'alice', 'password': 'secret'}).get_json()
+    assert 'access_token' not in client.post('/api/login', json={'username': 'alice', 'password': 'wrong'}).get_json()
+
+
+def test_refreshed_token_of_a_user_stored_without_role_version(app, client):
+    # stored before role_version existed
+    user_id = User._get_collection().insert_one({
+        'username': 'legacy', 'email': 'legacy@example.com', 'deleted_at': None,
+        'roles': [Role.default_role().to_mongo()]}).inserted_id
+    with app.app_context():
+        refresh_token = create_refresh_token(identity=str(user_id))
+
+    response = client.post('/api/token/refresh', headers={'Authorization': 'Bearer ' + refresh_token})
+    access_token = response.get_json()['access_token']
+
+    response = client.post('/api/posts/', headers={'Authorization': 'Bearer ' + access_token},
+                           json={'title': 'title', 'body': 'body', 'image_url': 'http://example.com/image.png'})
+    assert response.status_code == 201
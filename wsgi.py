@@ -1,5 +1,16 @@
+import os
+
+if os.getenv('GEVENT') == '1':
+    # patch before flask, pymongo or the app import socket, ssl and threading
+    from gevent import monkey
+    monkey.patch_all()
+
 from manage import app as application
 
 
 if __name__ == "__main__":
-    application.run()
\ No newline at end of file
+    if os.getenv('GEVENT') == '1':
+        from gevent.pywsgi import WSGIServer
+        WSGIServer(('127.0.0.1', int(os.getenv('PORT', 5000))), application).serve_forever()
+    else:
+        application.run()
\ No newline at end of file